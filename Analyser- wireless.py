@@ -1,184 +1,228 @@
-#LIVE SPECTRUM IMAGING ANALYSIS
-
-#Libraries
-import requests
-from PIL import Image
-import numpy as np
-import matplotlib.pyplot as plt
-from scipy.signal import find_peaks, savgol_filter
-import io
-
-#Elements with thier wavelengths
-element_data = {
-    "Hydrogen": [410.2, 434,486.1, 656.3],
-    "Helium": [587.6, 468.6, 667.8],
-    "Oxygen": [777.4, 844.6, 407],
-    "Nitrogen": [399.5, 460.1],
-    "Carbon": [247.9, 265.5, 357.7],
-    "Sodium":  [589, 589.9],
-    "Calcium": [393.4, 396.8, 422.2],
-    "Magnesium": [518.4, 577],
-    "Iron": [526.9, 532.8, 458.3],
-    "Boron": [249.7, 257.9],
-    "Aluminium": [396.1, 667.8],
-    "Silicon": [288.1, 390.5, 410.3],
-    "Sulphur": [921, 406.8],
-    "Chromium": [425.4, 427.5],
-    "Cobalt": [345.3, 350.5, 355.5],
-    "Strontium": [460.7, 421.5, 407.8],
-    "Radon": [508, 534.3],
-    "Platinum": [360.3, 405.8, 304.3],
-    "Silver": [328.1, 338.3, 481.3],
-    "Ruthenium": [265.8, 373.1, 410.3],
-    "Rhodium": [343.2, 373, 420.6],
-    "Palladium": [341.4, 350.5, 379.8],
-    "Tantalum": [260, 261.4, 277.1],
-    "Niobium": [341.8, 347, 384.3],
-    "Molybdenum": [314, 370, 385.5],
-    "Rhenium": [335, 350.2, 406],
-    "Osmium": [248.3, 278.6, 305.6],
-    "Iridium": [238.3, 251.6, 291],
-    "Tungsten": [312.3, 335, 400.9],
-    "Uranium": [328.3, 367.3, 405],
-    "Neodymium": [334.5, 354.9, 379.5],
-    "Samarium": [343.1, 364.8, 401.9],
-    "Europium": [420.3, 443, 552.1],
-    "Gadolinium": [ 335, 363, 393],
-    "Cerium": [404.7, 418.6, 422.7],
-    "Lanthanum" : [327.7, 379.5, 407.4],
-    "Neon": [585.2, 640.2],
-    "Actinum": [339, 403],
-    "Thorium": [401.9, 426.5, 433.6],
-    "Plutonium": [239.3, 315.2],
-    "Americium": [442, 548],
-    "Curium": [250, 291],
-    "Berkelium": [290, 315],
-    "Californium": [404, 442],
-    "Fermium": [283, 309],
-    "Mendelevium": [271, 310],
-    "Lawrencium": [340, 380],
-    "Rutherfordium": [271, 289],
-    "Dubnium": [278, 302],
-    "Seaborgium": [267, 291],
-    "Bohrium": [274, 295],
-    "Hassium": [252, 270],
-    "Lithium": [670.8, 610.3, 460.3],
-    "Beryllium": [234.8, 313.1],
-    "Fluorine": [685.6, 739.9],
-    "Chlorine": [725.7, 858.6],
-    "Argon": [696.5, 742.4],
-    "Copper": [324.7, 510.6, 327.4],
-    "Zinc": [213.9, 481],
-    "Lead": [405.8, 440.6],
-    "Nickel": [330.3, 341.5, 371],
-    "Titanium": [334.2, 336.1, 376.1],
-    "Manganese": [403.1, 404.4, 403.1],
-    "Zirconium": [347.1, 339.6, 346.4],
-    "Barium": [455.4, 493.4],
-    "Radium": [407.8, 442],
-    "Pottasium": [404.4, 769.9, 766.5],
-    "Phosphorus": [253.4, 178.3]
-}
-
-#Wavelength Calibration
-known_pixel_positions = [100, 500, 800, 1200]
-known_wavelengths = [400, 500, 600, 700]
-coefficients = np.polyfit(known_pixel_positions, known_wavelengths, 2)
-
-def pixel_to_wavelength(pixel):
-    return np.polyval(coefficients, pixel)
-
-def find_elements_near_peak(peak_wavelength, tolerance=10):
-    nearby_elements = []
-    for element, wavelengths in element_data.items():
-        for wl in wavelengths:
-            if abs(wl - peak_wavelength) <= tolerance:
-                nearby_elements.append((element, wl))
-    return nearby_elements
-
-#Stream Setup
-STREAM_URL = "http://device-ip:8080/shot.jpg"
-
-print("Starting live spectrum analysis...")
-
-#Stabilization Variables
-previous_intensity = None
-stabilization_factor = 0.9  # Adjust to smooth more or less
-
-#Real-time Processing
-plt.ion()
-fig, ax = plt.subplots()
-
-while True:
-    try:
-        #Fetching the latest frame
-        response = requests.get(STREAM_URL)
-        image_bytes = io.BytesIO(response.content)
-        image = Image.open(image_bytes)
-
-        #Conversion to grayscale and extract the spectrum region
-        gray_image = image.convert("L")
-        spectrum_region = np.array(gray_image.crop((0, 100, gray_image.width, 200)))  # Adjust ROI
-
-        #Calculation of intensity by averaging rows
-        intensity = np.mean(spectrum_region, axis=0)
-
-        #To stabilize intensity by averaging with previous frame
-        if previous_intensity is not None:
-            intensity = stabilization_factor * previous_intensity + (1 - stabilization_factor) * intensity
-        previous_intensity = intensity
-
-        #To smoothen the intensity values
-        smoothed_intensity = savgol_filter(intensity, window_length=11, polyorder=2)
-
-        #Calibrate pixel positions to wavelengths
-        pixels = np.arange(len(smoothed_intensity))
-        wavelengths = pixel_to_wavelength(pixels)
-
-        #Detect peaks in the spectrum
-        threshold = np.mean(smoothed_intensity) + np.std(smoothed_intensity) * 0.5
-        peaks, _ = find_peaks(smoothed_intensity, height=threshold)
-        peak_wavelengths = wavelengths[peaks]
-
-        #Identify elements at each peak
-        detected_elements = {}
-        for peak_wl in peak_wavelengths:
-            elements = find_elements_near_peak(peak_wl)
-            if elements:
-                detected_elements[peak_wl] = elements
-
-        #Display Results
-        ax.clear()
-        ax.plot(wavelengths, smoothed_intensity, label="Spectrum", color="blue")
-        ax.fill_between(wavelengths, smoothed_intensity, color="blue", alpha=0.1)  # Highlight area
-
-        #Highlight RGB regions
-        ax.axvspan(400, 500, color='blue', alpha=0.2, label="Blue Region")
-        ax.axvspan(500, 600, color='green', alpha=0.2, label="Green Region")
-        ax.axvspan(600, 700, color='red', alpha=0.2, label="Red Region")
-
-        #Annotate detected peaks and elements
-        for peak_wl, elements in detected_elements.items():
-            element_text = ', '.join([f"{el} ({wl:.1f} nm)" for el, wl in elements])
-            peak_index = np.where(wavelengths == peak_wl)[0]
-            if peak_index.size > 0:
-                peak_index = peak_index[0]
-                ax.annotate(element_text, (peak_wl, smoothed_intensity[peak_index]),
-                            textcoords="offset points", xytext=(0, 10), ha='center', fontsize=8, color="black",
-                            bbox=dict(boxstyle="round,pad=0.3", edgecolor="black", facecolor="white", alpha=0.8))
-
-        ax.set_xlabel("Wavelength (nm)")
-        ax.set_ylabel("Intensity")
-        ax.set_title("Live Spectrum Analysis")
-        ax.legend()
-        plt.pause(0.01)
-
-    except KeyboardInterrupt:
-        print("Stopping live analysis...")
-        break
-    except Exception as e:
-        print(f"Error: {e}")
-        continue
-
-plt.ioff()
-plt.show()
\ No newline at end of file
+#LIVE SPECTRUM IMAGING ANALYSIS
+
+#Libraries
+import os
+import sys
+import time
+from lumas import default_scorer, load_calibration
+from lumas.accumulate import FrameStack, load_correction, stack_frames
+from lumas.autocal import auto_calibrate
+from lumas.decode import FrameDecoder
+from lumas.live import process_frame
+from lumas.recording import FrameRecorder, ReplaySource
+from lumas.results import open_results, spectrum_record
+from lumas.stream import FrameFetcher, MJPEGStream
+from lumas.streaming import StreamingProcessor
+from lumas.timing import FrameProfiler, StageTimer
+
+#Stream Setup
+#'mjpeg' reads the continuous /video stream, 'shot' polls single JPEGs from /shot.jpg
+STREAM_MODE = "mjpeg"
+STREAM_URL = "http://device-ip:8080/shot.jpg"
+MJPEG_URL = "http://device-ip:8080/video"
+FETCH_TIMEOUT = 5  # Seconds before a frame request is given up
+
+#Record every camera frame with its arrival time to RECORD_FILE (None to skip), or analyse
+#a recording instead of the camera: REPLAY_FILE played at REPLAY_SPEED times the recorded rate,
+#or with REPLAY_SPEED = None as fast as the analysis goes (no dropped frames, same run every time)
+#Nothing is recorded while replaying, so RECORD_FILE is left untouched
+RECORD_FILE = None
+REPLAY_FILE = None
+REPLAY_SPEED = 1.0
+
+#Several rigs in one process: a JSON file listing the cameras (name, url, mode, roi, calibration,
+#tolerance; see lumas/multisource.py), all fetched concurrently with results merged into
+#RESULTS_OUTPUT (HEADLESS) or shown as tiled plots; None analyses the single stream above
+SOURCES_FILE = None
+
+#Rows of the frame that hold the spectrum
+ROI_TOP = 100
+ROI_BOTTOM = 200  # Adjust ROI
+
+#Saved wavelength calibration file, None uses the built-in calibration in lumas/calibration.py
+calibration_file = None
+
+#Auto-calibration: point the rig at a reference lamp when the session starts, the first
+#frame is matched against the lamp's lines and the fit is saved to calibration_file
+AUTO_CALIBRATE = False
+CALIBRATION_LAMP = "fluorescent"  # See lumas/autocal.py REFERENCE_LAMPS
+
+#With AUTO_CALIBRATE the file is written, not read, so start from the built-in calibration
+calibration = load_calibration(None if AUTO_CALIBRATE else calibration_file)
+
+#Show elements within ±10 nm of each peak wavelength
+tolerance = 10
+
+#Noise handling: STACK_FRAMES > 1 analyses the mean/median of the last frames instead of single
+#frames (set stabilization_factor to 0 then, the stack replaces its smoothing); with
+#STACK_ROLLING every frame updates the stack, otherwise one result per STACK_FRAMES frames
+STACK_FRAMES = 1
+STACK_METHOD = "mean"
+STACK_ROLLING = True
+
+#Dark-frame / flat-field correction file (python -m lumas.accumulate), None for no correction
+#CAPTURE_DARK_FRAMES > 0 records a new dark frame at start-up (block the light until it is done)
+#and saves it to CORRECTION_FILE
+CORRECTION_FILE = None
+CAPTURE_DARK_FRAMES = 0
+
+#Headless mode: no plotting, one JSON record per frame is written to RESULTS_OUTPUT
+#('-' for stdout, a file path, 'tcp://127.0.0.1:9000' or 'unix:///tmp/lumas.sock')
+HEADLESS = False
+RESULTS_OUTPUT = "-"
+
+#Redraws per second, analysis keeps running at full rate in between
+MAX_DISPLAY_FPS = 15
+
+#Print FPS and p50/p95/p99 time per stage every few seconds
+STATS_INTERVAL = 5
+STATS_OVERLAY = False  # Also show the stats line on the live plot
+
+#Profile the first frames with cProfile, 0 turns profiling off
+PROFILE_FRAMES = 0
+PROFILE_OUTPUT = "lumas.prof"  # Inspect with: python -m pstats lumas.prof
+
+#Status messages go to stderr in headless mode so stdout only carries records
+log = sys.stderr if HEADLESS else sys.stdout
+
+if SOURCES_FILE:
+    from lumas.multisource import load_sources, run_sources
+
+    run_sources(load_sources(SOURCES_FILE), RESULTS_OUTPUT, dashboard=not HEADLESS, timeout=FETCH_TIMEOUT,
+                stats_interval=STATS_INTERVAL, max_fps=MAX_DISPLAY_FPS, log=log)
+    sys.exit()
+
+print("Starting live spectrum analysis...", file=log)
+
+#Stabilization Variables
+stabilization_factor = 0.9  # Adjust to smooth more or less
+
+#Frames are fetched on a background thread over one keep-alive connection
+stats = StageTimer(STATS_INTERVAL)
+if REPLAY_FILE and RECORD_FILE and os.path.abspath(REPLAY_FILE) == os.path.abspath(RECORD_FILE):
+    print(f"Error: RECORD_FILE and REPLAY_FILE are both '{REPLAY_FILE}', recording would overwrite the replay.",
+          file=log)
+    sys.exit(1)
+recorder = FrameRecorder(RECORD_FILE) if RECORD_FILE and not REPLAY_FILE else None
+if REPLAY_FILE:
+    fetcher = ReplaySource(REPLAY_FILE, REPLAY_SPEED, timer=stats).start()
+elif STREAM_MODE == "mjpeg":
+    fetcher = MJPEGStream(MJPEG_URL, timeout=FETCH_TIMEOUT, timer=stats, recorder=recorder).start()
+else:
+    fetcher = FrameFetcher(STREAM_URL, timeout=FETCH_TIMEOUT, timer=stats, recorder=recorder).start()
+decoder = FrameDecoder(ROI_TOP, ROI_BOTTOM)
+
+correction = load_correction(CORRECTION_FILE)
+if CAPTURE_DARK_FRAMES:
+    print(f"Capturing {CAPTURE_DARK_FRAMES} dark frames, keep the light blocked...", file=log)
+    dark_frames = []
+    while len(dark_frames) < CAPTURE_DARK_FRAMES:
+        frame = fetcher.get(timeout=FETCH_TIMEOUT)
+        if frame is None:
+            break
+        dark_frames.append(decoder.intensity(frame.data).copy())
+    if dark_frames:
+        #The flat field from the file (if any) is kept, only the dark frame is replaced
+        flat = correction.flat
+        correction = load_correction()
+        correction.dark = stack_frames(dark_frames, STACK_METHOD)
+        correction.flat = flat
+        correction.save(CORRECTION_FILE or "correction.npz")
+        print(f"Dark frame saved from {len(dark_frames)} frames, unblock the light.", file=log)
+    else:
+        print("Error: no frames received for the dark frame, continuing without it.", file=log)
+stack = FrameStack(STACK_FRAMES, STACK_METHOD)
+
+if AUTO_CALIBRATE:
+    frame = fetcher.get(timeout=FETCH_TIMEOUT)
+    try:
+        if frame is None:
+            raise ValueError("no frame received")
+        calibration = auto_calibrate(decoder.intensity(frame.data), CALIBRATION_LAMP)
+        calibration.save(calibration_file or "calibration.json")
+        print(f"Auto-calibrated from {len(calibration.pixel_positions)} {CALIBRATION_LAMP} lines.", file=log)
+    except ValueError as e:
+        print(f"Error: auto-calibration failed ({e}), using the built-in calibration.", file=log)
+
+#Stateful per-frame analysis (smoothing kernel, threshold statistics and peak ids persist),
+#every frame also carries elements ranked on all of their lines
+processor = StreamingProcessor(tolerance, calibration, stabilization_factor=stabilization_factor, timer=stats,
+                               scorer=default_scorer(tolerance))
+
+#Real-time Processing
+if HEADLESS:
+    results = open_results(RESULTS_OUTPUT)
+else:
+    import matplotlib.pyplot as plt
+    from lumas.plotting import LiveRenderer
+
+    plt.ion()
+    fig, ax = plt.subplots()
+    renderer = LiveRenderer(fig, ax, max_fps=MAX_DISPLAY_FPS, calibration=calibration)
+    plt.show(block=False)
+
+profiler = FrameProfiler(PROFILE_FRAMES, PROFILE_OUTPUT, log=log)
+start_time = time.perf_counter()
+analysed = 0
+
+while True:
+    try:
+        #Waiting for the latest frame
+        with stats.stage('wait'):
+            frame = fetcher.get(timeout=FETCH_TIMEOUT)
+        if frame is None:
+            if fetcher.finished:
+                break
+            continue
+
+        #Grayscale crop of the spectrum rows, dark-frame / flat-field correction and frame stacking,
+        #then stabilization, smoothing, peak detection and tracking and element matching
+        #(each recorded as its own stage); None while a non-rolling stack is still filling
+        result = process_frame(frame.data, decoder, processor, stack, correction, STACK_ROLLING, stats)
+        if result is None:
+            continue
+
+        if HEADLESS:
+            with stats.stage('output'):
+                results.write(spectrum_record(result, frame.timestamp))
+        else:
+            #Display Results (only redrawn at the display rate)
+            renderer.update(result)
+            with stats.stage('plot'):
+                renderer.draw()
+
+        stats.frame_done()
+        profiler.frame_done()
+        analysed += 1
+        #Dropped: frames replaced in the fetch queue before analysis, not drawn: analysed but skipped by the display
+        counters = dict(dropped=fetcher.dropped, errors=fetcher.errors)
+        if not HEADLESS:
+            counters['not_drawn'] = renderer.skipped
+        report = stats.report(**counters)
+        if report:
+            print(report, file=log)
+            if STATS_OVERLAY and not HEADLESS:
+                renderer.set_overlay(report.replace(' | ', '\n'))
+
+    except KeyboardInterrupt:
+        print("Stopping live analysis...", file=log)
+        break
+    except Exception as e:
+        print(f"Error: {e}", file=log)
+        continue
+
+fetcher.stop()
+profiler.stop()
+if recorder is not None:
+    recorder.close()
+    print(f"Recorded {recorder.frames} frames to '{RECORD_FILE}'.", file=log)
+if REPLAY_FILE:
+    elapsed = time.perf_counter() - start_time
+    print(f"Replayed {fetcher.fetched} frames ({fetcher.dropped} dropped), analysed {analysed} in {elapsed:.1f} s: "
+          f"{analysed / elapsed:.1f} FPS", file=log)
+    print(stats.report(force=True), file=log)
+if HEADLESS:
+    results.close()
+else:
+    plt.ioff()
+    plt.show()
\ No newline at end of file
@@ -0,0 +1,152 @@
+#DECODE MEMORY BENCHMARK
+#Peak RSS and time per image of the old full-image decode paths against the lumas
+#low-memory paths. Every method runs in its own process so peak RSS is not shared.
+#
+#    python benchmarks/decode_memory.py                 # synthetic 12 MP and 48 MP JPEGs
+#    python benchmarks/decode_memory.py photo.jpg --repeats 5
+
+#Libraries
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+
+#Synthetic capture sizes (width, height)
+SIZES = {'12MP': (4000, 3000), '48MP': (8000, 6000)}
+
+
+#Old wired/manual path: full RGB array, then the float mean of one row
+def legacy_row(path):
+    image_array = np.array(Image.open(path).convert('RGB'))
+    return np.mean(image_array[100, :, :], axis=1)
+
+
+#Old wired/manual path with the band averaged in float
+def legacy_band(path):
+    image_array = np.array(Image.open(path).convert('RGB'))
+    return np.mean(image_array[100:200], axis=(0, 2))
+
+
+#Old live path: full grayscale conversion, then crop, then float mean
+def legacy_live(path):
+    with open(path, 'rb') as f:
+        image = Image.open(io.BytesIO(f.read()))
+    gray_image = image.convert("L")
+    return np.mean(np.array(gray_image.crop((0, 100, gray_image.width, 200))), axis=0)
+
+
+def lumas_row(path):
+    from lumas.decode import decode_intensity
+    return decode_intensity(path, 100)
+
+
+def lumas_band(path):
+    from lumas.decode import decode_intensity
+    return decode_intensity(path, (100, 200))
+
+
+def lumas_auto(path):
+    from lumas.decode import decode_intensity
+    return decode_intensity(path, 'auto')
+
+
+def lumas_live(path):
+    from lumas.decode import FrameDecoder
+    with open(path, 'rb') as f:
+        return FrameDecoder().intensity(f.read())
+
+
+METHODS = {
+    'legacy_row': legacy_row, 'lumas_row': lumas_row,
+    'legacy_band': legacy_band, 'lumas_band': lumas_band, 'lumas_auto': lumas_auto,
+    'legacy_live': legacy_live, 'lumas_live': lumas_live,
+}
+
+
+#Current and peak resident set size in MB (Linux /proc, ru_maxrss elsewhere)
+def _rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            fields = dict(line.split(':', 1) for line in f)
+        return int(fields['VmRSS'].split()[0]) / 1024, int(fields['VmHWM'].split()[0]) / 1024
+    except (OSError, KeyError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return peak, peak
+
+
+#Reset the peak so import-time allocations are not counted (Linux only)
+def _reset_peak():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+#Runs in the child process: prints peak RSS growth and seconds per image as JSON
+def child(method, path, repeats):
+    import lumas.decode  # noqa: F401  (imports are not part of the measurement)
+    _reset_peak()
+    baseline, _ = _rss_mb()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        METHODS[method](path)
+    seconds = (time.perf_counter() - start) / repeats
+    _, peak = _rss_mb()
+    print(json.dumps({'peak_rss_mb': peak - baseline, 'seconds_per_image': seconds}))
+
+
+#Dark frame with a bright spectrum band over 10% of the rows, like a real capture
+def synthetic_jpeg(folder, name, size):
+    width, height = size
+    rng = np.random.default_rng(0)
+    image_array = rng.integers(0, 24, (height, width, 3), dtype=np.uint8)
+    band = slice(height * 45 // 100, height * 55 // 100)
+    image_array[band] += rng.integers(80, 230, (1, width, 3), dtype=np.uint8)
+    path = os.path.join(folder, f'{name}.jpg')
+    Image.fromarray(image_array).save(path, quality=90)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Peak RSS and time per image for each decode path.")
+    parser.add_argument('images', nargs='*', help="images to decode, default synthetic 12 MP and 48 MP JPEGs")
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--methods', nargs='*', default=list(METHODS), choices=list(METHODS))
+    parser.add_argument('--json', help="also write the results to this file")
+    parser.add_argument('--child', nargs=2, metavar=('METHOD', 'IMAGE'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        child(args.child[0], args.child[1], args.repeats)
+        return
+
+    with tempfile.TemporaryDirectory() as folder:
+        images = args.images or [synthetic_jpeg(folder, name, size) for name, size in SIZES.items()]
+        results = []
+        for image in images:
+            for method in args.methods:
+                output = subprocess.run([sys.executable, os.path.abspath(__file__), '--repeats', str(args.repeats),
+                                         '--child', method, image], capture_output=True, text=True, check=True)
+                result = {'image': os.path.basename(image), 'method': method, **json.loads(output.stdout)}
+                results.append(result)
+                print(f"{result['image']:>16} {method:>12}  peak RSS {result['peak_rss_mb']:8.1f} MB  "
+                      f"{1000 * result['seconds_per_image']:8.1f} ms/image")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#LIVE PIPELINE REPLAY BENCHMARK
+#Plays a frame recording (python -m lumas.recording record ...) through the same stages as
+#the headless wireless analyser: decode, correction and stacking, streaming analysis with
+#element scoring and the JSON record. Frames are replayed as fast as they are analysed, so
+#nothing is dropped and every run processes the same frames. Without a recording a
+#synthetic one is made first.
+#
+#    python benchmarks/live_replay.py session.lrec
+#    python benchmarks/live_replay.py --frames 300 --width 1920
+
+#Libraries
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lumas.accumulate import FrameStack, load_correction
+from lumas.decode import ROI_BOTTOM, ROI_TOP, FrameDecoder
+from lumas.live import process_frame
+from lumas.recording import FrameRecorder, ReplaySource
+from lumas.results import open_results, spectrum_record
+from lumas.scoring import default_scorer
+from lumas.stream import Frame
+from lumas.streaming import StreamingProcessor
+from lumas.timing import StageTimer
+from pipeline import HEIGHT, synthetic_capture
+
+#Rows of the synthetic captures that hold the spectrum band
+SYNTHETIC_ROI = (HEIGHT * 2 // 5, HEIGHT * 3 // 5)
+
+
+#Recording of frame_count synthetic frames at fps (a few distinct captures in turn)
+def synthetic_recording(path, frame_count=300, fps=15, width=1920):
+    captures = [synthetic_capture(width, 20, seed) for seed in range(8)]
+    with FrameRecorder(path) as recorder:
+        for i in range(frame_count):
+            recorder.write(Frame(i / fps, captures[i % len(captures)]))
+    return path
+
+
+def run(path, roi=SYNTHETIC_ROI, stack_frames=1, correction_file=None, tolerance=10, rolling=True):
+    stats = StageTimer(report_interval=float('inf'), window=100000)
+    source = ReplaySource(path, speed=None, timer=stats).start()
+    decoder = FrameDecoder(*roi)
+    correction = load_correction(correction_file)
+    stack = FrameStack(stack_frames)
+    processor = StreamingProcessor(tolerance, stabilization_factor=0.9, timer=stats, scorer=default_scorer(tolerance))
+    results = open_results(os.devnull)
+
+    frames = analysed = 0
+    start = time.perf_counter()
+    while True:
+        with stats.stage('wait'):
+            frame = source.get()
+        if frame is None:
+            break
+        frames += 1
+        result = process_frame(frame.data, decoder, processor, stack, correction, rolling, stats)
+        if result is None:
+            continue
+        with stats.stage('output'):
+            results.write(spectrum_record(result, frame.timestamp))
+        stats.frame_done()
+        analysed += 1
+    elapsed = time.perf_counter() - start
+    source.stop()
+    results.close()
+
+    print(f"{frames} frames ({analysed} results) in {elapsed:.2f} s: {frames / elapsed:.1f} FPS")
+    for name, (p50, p95, p99) in stats.percentiles().items():
+        print(f"{name:>12}  p50 {p50 * 1000:7.3f} ms  p95 {p95 * 1000:7.3f} ms  p99 {p99 * 1000:7.3f} ms")
+    return frames / elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a frame recording through the live pipeline at full speed.")
+    parser.add_argument('recording', nargs='?', help="frame recording, default a synthetic one")
+    parser.add_argument('--roi', type=int, nargs=2, metavar=('TOP', 'BOTTOM'),
+                        help="spectrum rows, default lumas.decode's ROI (as the wireless script) for a recording "
+                             "and the band of a synthetic one")
+    parser.add_argument('--stack', type=int, default=1, help="stack length")
+    parser.add_argument('--no-rolling', action='store_true', help="one result per full stack instead of per frame")
+    parser.add_argument('--correction', help="dark-frame / flat-field file")
+    parser.add_argument('--frames', type=int, default=300, help="synthetic recording length")
+    parser.add_argument('--fps', type=float, default=15, help="synthetic recording rate")
+    parser.add_argument('--width', type=int, default=1920, help="synthetic frame width")
+    args = parser.parse_args(argv)
+
+    if args.recording:
+        run(args.recording, args.roi or (ROI_TOP, ROI_BOTTOM), args.stack, args.correction,
+            rolling=not args.no_rolling)
+        return
+    with tempfile.TemporaryDirectory() as folder:
+        path = synthetic_recording(os.path.join(folder, 'synthetic.lrec'), args.frames, args.fps, args.width)
+        run(path, args.roi or SYNTHETIC_ROI, args.stack, args.correction, rolling=not args.no_rolling)
+
+
+if __name__ == '__main__':
+    main()
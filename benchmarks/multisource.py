@@ -0,0 +1,132 @@
+#MULTI-SOURCE LIVE ANALYSIS BENCHMARK
+#Starts N local stub cameras (MJPEG /video and single-shot /shot.jpg, like the phone
+#camera apps) and runs lumas.multisource against them headless, reporting the analysed
+#frames per second, dropped frames and errors of every source. With --chunked the MJPEG
+#stubs send Transfer-Encoding: chunked, as most HTTP/1.1 servers do for open-ended streams;
+#frames that do not arrive byte-identical to what the stub served are counted as corrupt.
+#
+#    python benchmarks/multisource.py --sources 12 --fps 15 --seconds 10
+
+#Libraries
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lumas.multisource import MultiSourceAnalyser, Source
+from pipeline import synthetic_capture
+
+BOUNDARY = b'lumasframe'
+
+
+#Stub camera: serves a few prerecorded JPEGs in turn at a fixed frame rate
+#chunked: the MJPEG stream is sent chunked, every part split over two chunks inside the JPEG
+def stub_camera(frames, fps, chunked=False):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path == '/shot.jpg':
+                data = frames[int(time.time() * fps) % len(frames)]
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/jpeg')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', f"multipart/x-mixed-replace; boundary={BOUNDARY.decode()}")
+            if chunked:
+                self.send_header('Transfer-Encoding', 'chunked')
+            else:
+                self.send_header('Connection', 'close')
+            self.end_headers()
+            i = 0
+            try:
+                while True:
+                    data = frames[i % len(frames)]
+                    part = (b'--' + BOUNDARY + b'\r\nContent-Type: image/jpeg\r\n'
+                            + f"Content-Length: {len(data)}\r\n\r\n".encode() + data + b'\r\n')
+                    if chunked:
+                        middle = len(part) // 2
+                        part = b''.join(f"{len(piece):x}\r\n".encode() + piece + b'\r\n'
+                                        for piece in (part[:middle], part[middle:]))
+                    self.wfile.write(part)
+                    self.wfile.flush()
+                    i += 1
+                    time.sleep(1.0 / fps)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run(source_count=12, fps=15, seconds=10, mode='mjpeg', width=1920, workers=None, chunked=False):
+    frames = [synthetic_capture(width, 20, seed) for seed in range(4)]
+    served = set(frames)
+    servers = [stub_camera(frames, fps, chunked) for _ in range(source_count)]
+    path = '/video' if mode == 'mjpeg' else '/shot.jpg'
+    sources = [Source(f"cam-{i}", f"http://127.0.0.1:{server.server_address[1]}{path}", mode, roi=(160, 240))
+               for i, server in enumerate(servers)]
+
+    latency = []
+    corrupt = {source.name: 0 for source in sources}
+
+    def on_result(source, frame, result):
+        latency.append(time.time() - frame.timestamp)
+        if frame.data not in served:
+            corrupt[source.name] += 1
+
+    analyser = MultiSourceAnalyser(sources, on_result, workers, log=sys.stderr)
+
+    async def stop_later():
+        await asyncio.sleep(seconds)
+        analyser.stop()
+
+    start = time.perf_counter()
+    asyncio.run(analyser.run([stop_later()]))
+    elapsed = time.perf_counter() - start
+    for server in servers:
+        server.shutdown()
+
+    label = f"{mode}, chunked" if chunked else mode
+    print(f"{source_count} sources x {fps} FPS ({label}, {width} px), {elapsed:.1f} s:")
+    for worker in analyser.workers:
+        print(f"{worker.source.name:>8}  analysed {worker.analysed / elapsed:5.1f} FPS  fetched {worker.fetched:5d}  "
+              f"dropped {worker.dropped:4d}  errors {worker.errors}  corrupt {corrupt[worker.source.name]}")
+    total = sum(worker.analysed for worker in analyser.workers)
+    latency.sort()
+    p95 = latency[int(0.95 * (len(latency) - 1))] * 1000 if latency else float('nan')
+    print(f"   total  analysed {total / elapsed:5.1f} FPS  fetch-to-result p95 {p95:.1f} ms")
+    return analyser
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the multi-source analyser against local stub cameras.")
+    parser.add_argument('--sources', type=int, default=12)
+    parser.add_argument('--fps', type=float, default=15)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--mode', default='mjpeg', choices=('mjpeg', 'shot'))
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunked', action='store_true', help="MJPEG stubs send Transfer-Encoding: chunked")
+    args = parser.parse_args(argv)
+    run(args.sources, args.fps, args.seconds, args.mode, args.width, args.workers, args.chunked)
+
+
+if __name__ == '__main__':
+    main()
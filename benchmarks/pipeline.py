@@ -0,0 +1,168 @@
+#PIPELINE STAGE BENCHMARKS
+#Times every stage of the spectrum pipeline on its own, on synthetic captures of
+#several widths and line counts plus the repo's spectrum_image.jpg, and writes the
+#results to JSON so two versions can be compared.
+#
+#    python benchmarks/pipeline.py --output after.json
+#    python benchmarks/pipeline.py --output after.json --compare before.json
+
+#Libraries
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+from PIL import Image
+
+from lumas.calibration import Calibration, default_calibration
+from lumas.colors import wavelengths_to_rgb
+from lumas.lines import default_line_index
+from lumas.peaks import measure_peaks
+from lumas.pipeline import SPECTRUM_ROW, detect_peaks, row_intensity, smooth_intensity
+from lumas.scoring import default_scorer
+from lumas.streaming import SavgolSmoother
+
+WIDTHS = [1000, 2000, 4000]
+LINE_COUNTS = [5, 20, 80]
+HEIGHT = 400
+TOLERANCE = 10
+
+
+#JPEG bytes of a dark frame with a spectrum band: continuum plus line_count Gaussian lines
+def synthetic_capture(width, line_count, seed=0):
+    rng = np.random.default_rng(seed)
+    columns = np.arange(width)
+    profile = 40 + 30 * np.sin(columns / width * np.pi)
+    for center in rng.uniform(0, width, line_count):
+        profile += rng.uniform(40, 150) * np.exp(-0.5 * ((columns - center) / 2.5) ** 2)
+    profile = np.clip(profile, 0, 255)
+
+    image_array = rng.integers(0, 16, (HEIGHT, width, 3), dtype=np.uint8)
+    band = slice(HEIGHT * 2 // 5, HEIGHT * 3 // 5)
+    image_array[band] = np.clip(profile[None, :, None] + rng.normal(0, 3, (band.stop - band.start, width, 3)),
+                                0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(image_array).save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+#Seconds per call: median and minimum over repeat runs of an auto-sized loop
+def time_stage(fn, repeat):
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    runs = [seconds / number for seconds in timer.repeat(repeat=repeat, number=number)]
+    return {'median_s': statistics.median(runs), 'min_s': min(runs), 'number': number}
+
+
+#Stage name -> zero-argument callable, each working on the previous stage's output
+def stages(data):
+    image = Image.open(io.BytesIO(data))
+    image_array = np.asarray(image.convert('RGB'))
+    intensity = row_intensity(image_array, 'auto')
+    smoothed_intensity = smooth_intensity(intensity)
+    width = len(smoothed_intensity)
+    wavelengths = default_calibration.axis(width)
+    _, peaks, _, _ = detect_peaks(smoothed_intensity, intensity)
+    peak_wavelengths = wavelengths[peaks]
+    line_index = default_line_index()
+    scorer = default_scorer()
+    wavelength_range = (wavelengths[0], wavelengths[-1])
+    smoother = SavgolSmoother()
+
+    def decode():
+        with Image.open(io.BytesIO(data)) as frame:
+            frame.load()
+
+    return {
+        'decode': decode,
+        'intensity_row': lambda: row_intensity(image_array, SPECTRUM_ROW),
+        'intensity_band': lambda: row_intensity(image_array, 'auto'),
+        'smoothing': lambda: smooth_intensity(intensity),
+        'smoothing_streaming': lambda: smoother(intensity),
+        'calibration': lambda: Calibration(default_calibration.pixel_positions,
+                                           default_calibration.wavelengths).axis(width),
+        'calibration_cached': lambda: default_calibration.axis(width),
+        'peak_detection': lambda: detect_peaks(smoothed_intensity, intensity),
+        'peak_detection_global': lambda: detect_peaks(smoothed_intensity, method='global'),
+        'peak_refinement': lambda: measure_peaks(intensity, smoothed_intensity, peaks, default_calibration),
+        'element_matching': lambda: line_index.query(peak_wavelengths, TOLERANCE),
+        'element_scoring': lambda: scorer.score(peak_wavelengths, smoothed_intensity[peaks], wavelength_range),
+        'color_mapping': lambda: wavelengths_to_rgb(wavelengths),
+    }
+
+
+def cases(widths, line_counts):
+    for width in widths:
+        for line_count in line_counts:
+            yield f'synthetic-{width}px-{line_count}lines', width, line_count, synthetic_capture(width, line_count)
+    sample = os.path.join(ROOT, 'spectrum_image.jpg')
+    if os.path.exists(sample):
+        with open(sample, 'rb') as f:
+            data = f.read()
+        with Image.open(io.BytesIO(data)) as image:
+            width = image.width
+        yield 'spectrum_image.jpg', width, None, data
+
+
+def run(widths=WIDTHS, line_counts=LINE_COUNTS, repeat=5, only=None):
+    results = []
+    for case, width, line_count, data in cases(widths, line_counts):
+        for stage, fn in stages(data).items():
+            if only and stage not in only:
+                continue
+            timing = time_stage(fn, repeat)
+            results.append({'case': case, 'width': width, 'lines': line_count, 'stage': stage, **timing})
+            print(f"{case:>32} {stage:>20} {1e6 * timing['median_s']:12.1f} us")
+    return {
+        'meta': {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+
+
+#Print median time ratios (current / baseline) for every stage found in both runs
+def compare(current, baseline):
+    before = {(r['case'], r['stage']): r['median_s'] for r in baseline['results']}
+    print(f"\n{'case':>32} {'stage':>20} {'before us':>12} {'after us':>12} {'ratio':>7}")
+    for r in current['results']:
+        key = (r['case'], r['stage'])
+        if key in before:
+            print(f"{r['case']:>32} {r['stage']:>20} {1e6 * before[key]:12.1f} {1e6 * r['median_s']:12.1f} "
+                  f"{r['median_s'] / before[key]:7.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time each spectrum pipeline stage on its own.")
+    parser.add_argument('--widths', type=int, nargs='*', default=WIDTHS)
+    parser.add_argument('--lines', type=int, nargs='*', default=LINE_COUNTS)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--stages', nargs='*', help="only run these stages")
+    parser.add_argument('--output', help="write results to this JSON file")
+    parser.add_argument('--compare', help="JSON file of an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    report = run(args.widths, args.lines, args.repeat, args.stages)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,12 @@
+#LUMAS - Light Used Material Analysis Spectroscopy
+#Shared code used by the three Analyser scripts
+#Matplotlib is only imported by lumas.plotting, so importing lumas stays headless
+
+from .calibration import Calibration, default_calibration, load_calibration, pixel_to_wavelength, wavelength_axis
+from .colors import spectrum_colors, wavelength_to_rgb, wavelengths_to_rgb
+from .decode import decode_intensity
+from .elements import element_data
+from .linedb import LineTable, default_line_table, load_line_table
+from .lines import LineIndex, default_line_index, find_elements_near_peak
+from .pipeline import SpectrumResult, analyse, analyse_image, analyse_intensity, load_image_array
+from .scoring import Candidate, ElementScorer, default_scorer, print_candidates, rank_elements
@@ -0,0 +1,181 @@
+#FRAME ACCUMULATION AND DETECTOR CORRECTION
+#Stacks several short exposures into one low-noise intensity vector and removes the
+#detector's dark signal and pixel-to-pixel response (flat field) before analysis
+
+#Libraries
+import argparse
+
+import numpy as np
+
+from .decode import decode_intensity
+from .pipeline import SPECTRUM_ROW, parse_row
+
+STACK_METHODS = ('mean', 'median')
+
+
+#Last `length` intensity vectors in a preallocated ring buffer (length x width)
+#mean keeps a running sum, so adding a frame costs one row copy and two vector adds
+#median is computed over the filled rows when the result is asked for
+#The returned array is reused by the next call, copy it to keep it
+class FrameStack:
+    def __init__(self, length, method='mean'):
+        if method not in STACK_METHODS:
+            raise ValueError(f"Unknown stack method '{method}', use one of {', '.join(STACK_METHODS)}.")
+        self.length = length
+        self.method = method
+        self.buffer = None
+        self.reset()
+
+    #Empty the stack (the buffer is kept while the width stays the same)
+    def reset(self):
+        self.count = 0
+        self.position = 0
+        if self.buffer is not None:
+            self.total[:] = 0
+
+    def __len__(self):
+        return min(self.count, self.length)
+
+    #True once `length` frames have been added since the last reset
+    @property
+    def full(self):
+        return self.count >= self.length
+
+    def add(self, intensity):
+        intensity = np.asarray(intensity, dtype=float)
+        if self.buffer is None or self.buffer.shape[1] != len(intensity):
+            self.buffer = np.zeros((self.length, len(intensity)))
+            self.total = np.zeros(len(intensity))
+            self._result = np.empty(len(intensity))
+            self.count = 0
+            self.position = 0
+        row = self.buffer[self.position]
+        if self.count >= self.length:
+            self.total -= row
+        row[:] = intensity
+        self.total += row
+        self.position = (self.position + 1) % self.length
+        self.count += 1
+        #Re-summed now and then so float rounding in the running sum cannot build up
+        if self.count % (64 * self.length) == 0:
+            self.buffer.sum(axis=0, out=self.total)
+
+    #Mean or median of the frames in the stack
+    def value(self):
+        filled = len(self)
+        if not filled:
+            raise ValueError("The frame stack is empty.")
+        if self.method == 'median':
+            return np.median(self.buffer[:filled], axis=0, out=self._result)
+        return np.divide(self.total, filled, out=self._result)
+
+
+#Mean or median of a list of intensity vectors
+def stack_frames(frames, method='mean'):
+    stack = FrameStack(len(frames), method)
+    for frame in frames:
+        stack.add(frame)
+    return stack.value().copy()
+
+
+#Dark-frame subtraction and flat-field correction of intensity vectors
+#dark: signal with no light (same exposure), flat: response to an even light source,
+#stored dark-subtracted and normalised to mean 1; columns with too little flat signal
+#are left uncorrected instead of being blown up
+class DetectorCorrection:
+    def __init__(self, dark=None, flat=None, min_flat=0.05):
+        self.dark = None if dark is None else np.asarray(dark, dtype=float)
+        self.flat = None
+        if flat is not None:
+            flat = np.asarray(flat, dtype=float)
+            if self.dark is not None:
+                flat = flat - self.dark
+            flat = flat / flat.mean()
+            self.flat = np.where(flat > min_flat, flat, 1.0)
+        self._corrected = None
+
+    #Built from raw dark and flat frames (each a list of intensity vectors, averaged)
+    @classmethod
+    def from_frames(cls, dark_frames=None, flat_frames=None, method='mean'):
+        dark = stack_frames(dark_frames, method) if dark_frames else None
+        flat = stack_frames(flat_frames, method) if flat_frames else None
+        return cls(dark, flat)
+
+    @property
+    def width(self):
+        reference = self.dark if self.dark is not None else self.flat
+        return None if reference is None else len(reference)
+
+    #(intensity - dark) / flat, written into a reused buffer (copy it to keep it)
+    def apply(self, intensity):
+        intensity = np.asarray(intensity, dtype=float)
+        if self.width is None:
+            return intensity
+        if len(intensity) != self.width:
+            raise ValueError(f"Correction is for {self.width} px wide spectra, got {len(intensity)} px.")
+        if self._corrected is None or len(self._corrected) != len(intensity):
+            self._corrected = np.empty(len(intensity))
+        corrected = self._corrected
+        if self.dark is not None:
+            np.subtract(intensity, self.dark, out=corrected)
+        else:
+            corrected[:] = intensity
+        if self.flat is not None:
+            corrected /= self.flat
+        return corrected
+
+    def save(self, path):
+        arrays = {}
+        if self.dark is not None:
+            arrays['dark'] = self.dark
+        if self.flat is not None:
+            arrays['flat'] = self.flat
+        np.savez(path, **arrays)
+
+    #The stored flat is already normalised, so it is set directly
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            correction = cls(data['dark'] if 'dark' in data else None)
+            if 'flat' in data:
+                correction.flat = data['flat']
+        return correction
+
+
+#Correction from a saved file, or one that leaves spectra unchanged when path is None
+def load_correction(path=None):
+    return DetectorCorrection.load(path) if path else DetectorCorrection()
+
+
+#Stacked, corrected intensity of several image files of the same scene
+def stacked_intensity(paths, row=SPECTRUM_ROW, method='mean', correction=None):
+    stack = FrameStack(len(paths), method)
+    for path in paths:
+        intensity = decode_intensity(path, row)
+        stack.add(correction.apply(intensity) if correction is not None else intensity)
+    return stack.value().copy()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build a dark-frame / flat-field correction file from captures.")
+    parser.add_argument('--dark', nargs='*', default=[], help="captures with the light blocked")
+    parser.add_argument('--flat', nargs='*', default=[], help="captures of an even, broadband light source")
+    parser.add_argument('--output', default='correction.npz')
+    #'auto' finds the brightest band, which a dark frame does not have: use the rows the spectrum is read from
+    parser.add_argument('--row', type=parse_row, default=SPECTRUM_ROW, help="row number or top:bottom")
+    parser.add_argument('--method', default='mean', choices=STACK_METHODS)
+    args = parser.parse_args(argv)
+    if not args.dark and not args.flat:
+        parser.error("give --dark and/or --flat captures")
+    if args.row == 'auto':
+        parser.error("use a fixed row or top:bottom band, 'auto' cannot find the band in dark frames")
+
+    correction = DetectorCorrection.from_frames([decode_intensity(path, args.row) for path in args.dark],
+                                                [decode_intensity(path, args.row) for path in args.flat],
+                                                args.method)
+    correction.save(args.output)
+    print(f"Correction from {len(args.dark)} dark and {len(args.flat)} flat captures saved to '{args.output}'.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+#SPECTRUM ARCHIVE
+#Append-only store of every analysed spectrum, so a day's captures can be re-analysed
+#(new line data, tolerances, thresholds) without decoding a single image again
+#
+#    archive/
+#        segment-000000/
+#            intensity.npy   float32 rows (capacity x width), memory-mapped, unused rows are zero
+#            axis-000.npy    wavelength axes, each stored once per segment
+#            records.jsonl   one line per row: archive index, name, timestamp, axis, peaks, peak wavelengths
+#
+#A segment holds spectra of one width, one segment per width is open for appending until it is
+#full; archive indices count appends across all segments. Only one process may append.
+
+#Libraries
+import argparse
+import json
+import os
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from .calibration import load_calibration
+from .pipeline import analyse_intensity
+
+SEGMENT_SIZE = 4096
+
+#One stored spectrum
+ArchivedSpectrum = namedtuple('ArchivedSpectrum', ['index', 'name', 'timestamp', 'wavelengths', 'intensity',
+                                                   'peaks', 'peak_wavelengths'])
+
+
+#Stored wavelength axis standing in for a Calibration during replay
+class AxisCalibration:
+    def __init__(self, wavelengths):
+        self.wavelengths = np.asarray(wavelengths, dtype=float)
+        self._pixels = np.arange(len(self.wavelengths))
+
+    def axis(self, width):
+        if width != len(self.wavelengths):
+            raise ValueError(f"Stored axis has {len(self.wavelengths)} px, got {width} px.")
+        return self.wavelengths
+
+    def pixel_to_wavelength(self, pixel):
+        return np.interp(pixel, self._pixels, self.wavelengths)
+
+    #Fractional pixel position of each wavelength, like Calibration.wavelength_to_pixel
+    def wavelength_to_pixel(self, wavelength, width):
+        axis = self.axis(width)
+        if len(axis) > 1 and axis[-1] < axis[0]:
+            return np.interp(wavelength, axis[::-1], self._pixels[::-1].astype(float))
+        return np.interp(wavelength, axis, self._pixels.astype(float))
+
+
+class _Segment:
+    def __init__(self, folder):
+        self.folder = folder
+        self.records = []
+        path = os.path.join(folder, 'records.jsonl')
+        if os.path.exists(path):
+            with open(path) as f:
+                self.records = [json.loads(line) for line in f if line.strip()]
+        self.intensity = np.load(os.path.join(folder, 'intensity.npy'), mmap_mode='r')
+        self.axis_count = sum(name.startswith('axis-') for name in os.listdir(folder))
+        self._axes = {}
+
+    @property
+    def width(self):
+        return self.intensity.shape[1]
+
+    @property
+    def full(self):
+        return len(self.records) >= len(self.intensity)
+
+    def axis(self, axis_id):
+        axis = self._axes.get(axis_id)
+        if axis is None:
+            axis = self._axes[axis_id] = np.load(os.path.join(self.folder, f'axis-{axis_id:03d}.npy'))
+        return axis
+
+
+#Chunked, memory-mapped store of analysed spectra
+class SpectrumArchive:
+    def __init__(self, folder, segment_size=SEGMENT_SIZE):
+        self.folder = folder
+        self.segment_size = segment_size
+        os.makedirs(folder, exist_ok=True)
+        names = sorted(name for name in os.listdir(folder) if name.startswith('segment-'))
+        self.segments = [_Segment(os.path.join(folder, name)) for name in names]
+        #Archive index -> (segment number, row)
+        located = sorted((record['index'], segment_id, row) for segment_id, segment in enumerate(self.segments)
+                         for row, record in enumerate(segment.records))
+        self._locations = [(segment_id, row) for _, segment_id, row in located]
+        #width -> (segment, records file) of the segment taking appends of that width
+        self._writers = {}
+
+    def __len__(self):
+        return len(self._locations)
+
+    def close(self):
+        for _, records_file in self._writers.values():
+            records_file.close()
+        self._writers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    #Segment open for appending spectra of this width: the newest segment of that width, or a
+    #new one when there is none or it is full
+    def _segment_for(self, width):
+        writer = self._writers.get(width)
+        if writer is not None and not writer[0].full:
+            return writer
+        if writer is not None:
+            writer[1].close()
+            segment = None
+        else:
+            segment = next((segment for segment in reversed(self.segments) if segment.width == width), None)
+        if segment is None or segment.full:
+            folder = os.path.join(self.folder, f'segment-{len(self.segments):06d}')
+            os.makedirs(folder)
+            np.lib.format.open_memmap(os.path.join(folder, 'intensity.npy'), 'w+', np.float32,
+                                      (self.segment_size, width)).flush()
+            segment = _Segment(folder)
+            self.segments.append(segment)
+        segment.intensity = np.load(os.path.join(segment.folder, 'intensity.npy'), mmap_mode='r+')
+        writer = self._writers[width] = (segment, open(os.path.join(segment.folder, 'records.jsonl'), 'a'))
+        return writer
+
+    #Stores the intensity, axis and peaks of a SpectrumResult, returns its archive index
+    def append(self, result, name='', timestamp=None):
+        intensity = np.asarray(result.intensity)
+        wavelengths = np.asarray(result.wavelengths, dtype=float)
+        segment, records_file = self._segment_for(len(intensity))
+
+        #The axis is only written when it differs from the last one in this segment
+        axis_id = segment.axis_count - 1
+        if axis_id < 0 or not np.array_equal(segment.axis(axis_id), wavelengths):
+            axis_id = segment.axis_count
+            np.save(os.path.join(segment.folder, f'axis-{axis_id:03d}.npy'), wavelengths)
+            segment.axis_count += 1
+
+        row = len(segment.records)
+        segment.intensity[row] = intensity
+        segment.intensity.flush()
+        index = len(self._locations)
+        record = {
+            'index': index,
+            'name': name,
+            'timestamp': time.time() if timestamp is None else timestamp,
+            'axis': axis_id,
+            'peaks': np.asarray(result.peaks).tolist(),
+            'peak_wavelengths': [round(wl, 4) for wl in np.asarray(result.peak_wavelengths).tolist()],
+        }
+        #The record line is written last, a row only counts once its line is on disk
+        records_file.write(json.dumps(record) + '\n')
+        records_file.flush()
+        segment.records.append(record)
+        self._locations.append((self.segments.index(segment), row))
+        return index
+
+    def _locate(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"Archive index {index} out of range ({len(self)} spectra).")
+        segment_id, row = self._locations[index]
+        return self.segments[segment_id], row, index
+
+    #Random access to one stored spectrum (the intensity row is read from the memory map)
+    def __getitem__(self, index):
+        segment, row, index = self._locate(index)
+        record = segment.records[row]
+        return ArchivedSpectrum(index, record['name'], record['timestamp'], segment.axis(record['axis']),
+                                np.asarray(segment.intensity[row], dtype=float), np.asarray(record['peaks']),
+                                np.asarray(record['peak_wavelengths']))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    #Indices of spectra whose name contains text and/or whose timestamp is in [start, end)
+    def select(self, text=None, start=None, end=None):
+        indices = []
+        for index, (segment_id, row) in enumerate(self._locations):
+            record = self.segments[segment_id].records[row]
+            if text is not None and text not in record['name']:
+                continue
+            if start is not None and record['timestamp'] < start:
+                continue
+            if end is not None and record['timestamp'] >= end:
+                continue
+            indices.append(index)
+        return indices
+
+    #Re-runs smoothing, peak detection and element matching on stored spectra (all, or the given
+    #indices) straight from the archive; yields (ArchivedSpectrum, SpectrumResult)
+    #calibration=None keeps each spectrum's stored wavelength axis
+    def replay(self, indices=None, tolerance=10, calibration=None, line_index=None, scorer=None, **kwargs):
+        for index in range(len(self)) if indices is None else indices:
+            spectrum = self[index]
+            result = analyse_intensity(spectrum.intensity, tolerance,
+                                       calibration or AxisCalibration(spectrum.wavelengths), line_index,
+                                       scorer=scorer, **kwargs)
+            yield spectrum, result
+
+
+def main(argv=None):
+    from .batch import open_summary_csv, summary_row
+
+    parser = argparse.ArgumentParser(description="Re-analyse archived spectra without decoding any image.")
+    parser.add_argument('archive')
+    parser.add_argument('--output', default='replay.csv', help="summary CSV of the replayed spectra")
+    parser.add_argument('--tolerance', type=float, default=2)
+    parser.add_argument('--calibration', help="new calibration file, default each spectrum's stored axis")
+    parser.add_argument('--name', help="only spectra whose name contains this text")
+    args = parser.parse_args(argv)
+
+    archive = SpectrumArchive(args.archive)
+    calibration = load_calibration(args.calibration) if args.calibration else None
+    indices = archive.select(args.name) if args.name else None
+    start = time.perf_counter()
+    count = 0
+    f, writer = open_summary_csv(args.output)
+    with f:
+        for spectrum, result in archive.replay(indices, args.tolerance, calibration):
+            writer.writerow(summary_row(spectrum.name, result))
+            count += 1
+    print(f"Replayed {count} spectra in {time.perf_counter() - start:.1f} s, summary written to '{args.output}'.")
+
+
+if __name__ == '__main__':
+    main()
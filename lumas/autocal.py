@@ -0,0 +1,218 @@
+#AUTOMATIC CALIBRATION FROM A REFERENCE LAMP
+#Detects the peaks of a capture of a known source, matches their pattern to the
+#source's reference lines and fits the pixel -> wavelength polynomial
+
+#Libraries
+import argparse
+
+import numpy as np
+from scipy.signal import peak_widths
+
+from .calibration import Calibration
+from .elements import element_data
+from .decode import decode_intensity
+from .pipeline import SPECTRUM_ROW, detect_peaks, parse_row, row_intensity, smooth_intensity
+
+#Reference lines (nm) of the sources we calibrate against
+REFERENCE_LAMPS = {
+    #Compact fluorescent lamp: mercury lines plus the strongest Tb/Eu phosphor lines
+    'fluorescent': [404.66, 435.83, 487.7, 542.4, 546.07, 577.0, 579.07, 611.6],
+    #Mercury/argon calibration lamp
+    'hg-ar': [404.66, 435.83, 546.07, 576.96, 579.07, 696.54, 706.72, 738.4, 750.39, 763.51],
+    'hydrogen': sorted(element_data['Hydrogen']),
+    'hydrogen-neon': sorted(element_data['Hydrogen'] + element_data['Neon']),
+}
+
+#A fit is only accepted when it matches at least degree + 2 lines and this share of the
+#resolvable reference lines (or of the detected peaks, when fewer peaks are in view), with at
+#most this RMS residual (nm); random peaks match a few lines by chance, a lamp matches nearly all
+MIN_MATCHED_FRACTION = 0.85
+MAX_RMS_RESIDUAL = 0.5
+
+#Hypotheses are scored in blocks of this many to bound memory
+_BLOCK = 4096
+
+
+#Strongest max_peaks peaks of an intensity vector, as ascending pixel positions
+def lamp_peaks(intensity, max_peaks=20):
+    smoothed_intensity = smooth_intensity(intensity)
+    _, peaks, _, _ = detect_peaks(smoothed_intensity, intensity)
+    if len(peaks) > max_peaks:
+        strongest = np.argsort(smoothed_intensity[peaks])[::-1][:max_peaks]
+        peaks = np.sort(peaks[strongest])
+    return peaks.astype(float)
+
+
+#Median full width at half maximum of the peaks of an intensity vector, in pixels
+def lamp_line_width(intensity, peaks):
+    if not len(peaks):
+        return 0.0
+    widths, _, _, _ = peak_widths(smooth_intensity(intensity), np.asarray(peaks, dtype=np.intp), 0.5)
+    return float(np.median(widths))
+
+
+#Reference lines closer together than width (nm) show as one peak, each such group is
+#replaced by its mean wavelength
+#Returns (wavelengths, half spreads), the blend's peak may lie anywhere within the half spread
+def merge_blended_lines(references, width):
+    references = np.sort(np.asarray(references, dtype=float))
+    groups = np.split(references, np.flatnonzero(np.diff(references) >= width) + 1) if len(references) else []
+    return (np.array([group.mean() for group in groups]),
+            np.array([(group[-1] - group[0]) / 2 for group in groups]))
+
+
+#Linear pixel -> wavelength hypotheses from every (peak pair, reference pair), the pair's lines
+#taken in either order as the wavelength may rise or fall along the pixels
+#Returns (slopes, intercepts) with the slope magnitudes inside slope_range
+def _hypotheses(pixels, references, slope_range):
+    pi, pj = np.triu_indices(len(pixels), k=1)
+    ra, rb = np.triu_indices(len(references), k=1)
+    ra, rb = np.concatenate([ra, rb]), np.concatenate([rb, ra])
+    slopes = (references[rb] - references[ra])[None, :] / (pixels[pj] - pixels[pi])[:, None]
+    intercepts = references[ra][None, :] - slopes * pixels[pi][:, None]
+    slopes = slopes.ravel()
+    intercepts = intercepts.ravel()
+    keep = (np.abs(slopes) >= slope_range[0]) & (np.abs(slopes) <= slope_range[1])
+    return slopes[keep], intercepts[keep]
+
+
+#For predicted peak wavelengths, each reference line's nearest peak and its distance
+def _nearest(predicted, references):
+    distances = np.abs(predicted[..., :, None] - references)
+    return distances.argmin(axis=-2), distances.min(axis=-2)
+
+
+#(peak pixel, reference wavelength) pairs within tolerance, one reference per peak
+def _matched_pairs(predicted, pixels, references, tolerance):
+    nearest, distance = _nearest(predicted, references)
+    pairs = {}
+    for line, (peak, dist) in enumerate(zip(nearest, distance)):
+        if dist <= tolerance and (peak not in pairs or dist < pairs[peak][1]):
+            pairs[peak] = (line, dist)
+    peaks = sorted(pairs)
+    return pixels[peaks], references[[pairs[peak][0] for peak in peaks]]
+
+
+#Refit the polynomial to the matched lines and match again until the pairs settle
+#Returns (pixels, wavelengths, rms residual) or None if fewer than two lines match
+def _refine(predicted, pixels, references, degree, tolerance, iterations=3):
+    matched_pixels, matched_wavelengths = _matched_pairs(predicted, pixels, references, tolerance)
+    for _ in range(iterations):
+        if len(matched_pixels) < 2:
+            return None
+        coefficients = np.polyfit(matched_pixels, matched_wavelengths, min(degree, len(matched_pixels) - 1))
+        previous = matched_pixels
+        matched_pixels, matched_wavelengths = _matched_pairs(np.polyval(coefficients, pixels), pixels, references,
+                                                             tolerance)
+        if np.array_equal(previous, matched_pixels):
+            break
+    if len(matched_pixels) < 2:
+        return None
+    fit_degree = min(degree, len(matched_pixels) - 1)
+    residual = matched_wavelengths - np.polyval(np.polyfit(matched_pixels, matched_wavelengths, fit_degree),
+                                                matched_pixels)
+    return matched_pixels, matched_wavelengths, float(np.sqrt(np.mean(residual ** 2)))
+
+
+#Best polynomial fit of the peaks to the reference lines, as (pixels, wavelengths, rms residual)
+#Every (peak pair, reference pair) gives a linear hypothesis; all of them are scored at
+#once by how many reference lines they land within linear_tolerance nm of a peak, and
+#the best candidates are refined with the polynomial fit at tolerance nm
+def _best_fit(pixels, references, degree, tolerance, linear_tolerance, slope_range, candidates):
+    slopes, intercepts = _hypotheses(pixels, references, slope_range)
+    if not len(slopes):
+        raise ValueError("No peak spacing fits the reference lines within the slope range.")
+
+    #Score every hypothesis: reference lines matched, then total distance
+    counts = np.empty(len(slopes), dtype=np.intp)
+    residuals = np.empty(len(slopes))
+    for start in range(0, len(slopes), _BLOCK):
+        block = slice(start, start + _BLOCK)
+        predicted = intercepts[block, None] + slopes[block, None] * pixels
+        _, distance = _nearest(predicted, references)
+        matched = distance <= linear_tolerance
+        counts[block] = matched.sum(axis=1)
+        residuals[block] = np.where(matched, distance, 0.0).sum(axis=1)
+
+    #Refine the best few and keep the one that matches most lines with the smallest residual
+    best = None
+    for i in np.lexsort((residuals, -counts))[:candidates]:
+        refined = _refine(intercepts[i] + slopes[i] * pixels, pixels, references, degree, tolerance)
+        if refined is not None and (best is None or (len(refined[0]), -refined[2]) > (len(best[0]), -best[2])):
+            best = refined
+    if best is None:
+        raise ValueError("Fewer than two peaks matched the reference lines.")
+    return best
+
+
+#Fit a Calibration to an intensity vector from a capture of a known source
+#reference is a REFERENCE_LAMPS name or a list of wavelengths
+#Reference lines closer than the measured line width (the peaks' median FWHM at the first fit's
+#dispersion) cannot be told apart, they are merged and the fit is repeated against the
+#resolvable lines
+#slope_range bounds the nm per pixel of a hypothesis, in either direction
+#Raises ValueError when the best fit fails the MIN_MATCHED_FRACTION / MAX_RMS_RESIDUAL checks
+def auto_calibrate(intensity, reference='fluorescent', degree=2, tolerance=3.0, linear_tolerance=6.0,
+                   slope_range=(0.02, 2.0), max_peaks=20, candidates=64, min_fraction=MIN_MATCHED_FRACTION,
+                   max_rms=MAX_RMS_RESIDUAL):
+    references = np.sort(np.asarray(REFERENCE_LAMPS[reference] if isinstance(reference, str) else reference,
+                                    dtype=float))
+    pixels = lamp_peaks(intensity, max_peaks)
+    if len(pixels) < 2 or len(references) < 2:
+        raise ValueError("Auto-calibration needs at least two detected peaks and two reference lines.")
+
+    settings = (degree, tolerance, linear_tolerance, slope_range, candidates)
+    best = _best_fit(pixels, references, *settings)
+    dispersion = abs(np.polyfit(best[0], best[1], 1)[0])
+    resolvable, spreads = merge_blended_lines(references, lamp_line_width(intensity, pixels) * dispersion)
+    if len(resolvable) < len(references):
+        references = resolvable
+        best = _best_fit(pixels, references, *settings)
+
+    matched_pixels, matched_wavelengths, _ = best
+    #A blended line's residual only counts beyond its half spread
+    fit_degree = min(degree, len(matched_pixels) - 1)
+    residual = matched_wavelengths - np.polyval(np.polyfit(matched_pixels, matched_wavelengths, fit_degree),
+                                                matched_pixels)
+    slack = spreads[np.searchsorted(resolvable, matched_wavelengths)]
+    rms = float(np.sqrt(np.mean(np.maximum(np.abs(residual) - slack, 0.0) ** 2)))
+    needed = max(degree + 2, int(np.ceil(min_fraction * min(len(references), len(pixels)))))
+    if len(matched_pixels) < needed:
+        raise ValueError(f"Only {len(matched_pixels)} of {len(pixels)} peaks matched the {len(references)} "
+                         f"resolvable reference lines ({needed} needed), is the lamp in view?")
+    if rms > max_rms:
+        raise ValueError(f"Calibration fit residual {rms:.2f} nm is above {max_rms} nm.")
+    calibration = Calibration(matched_pixels, matched_wavelengths, degree)
+    #The fitted curve has to stay a plausible dispersion over the whole width, not only at the lines
+    steps = np.diff(calibration.axis(len(intensity)))
+    slopes = np.abs(steps)
+    if not (np.all(steps > 0) or np.all(steps < 0)) or slopes.min() < slope_range[0] or slopes.max() > slope_range[1]:
+        raise ValueError("The calibration fit is not monotonic within the slope range across the image.")
+    return calibration
+
+
+#Auto-calibrate from an RGB capture, optionally saving the result for reuse
+def calibrate_from_image(image_array, reference='fluorescent', row=SPECTRUM_ROW, output_path=None, **kwargs):
+    calibration = auto_calibrate(row_intensity(image_array, row), reference, **kwargs)
+    if output_path is not None:
+        calibration.save(output_path)
+    return calibration
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit a wavelength calibration from a reference lamp capture.")
+    parser.add_argument('image')
+    parser.add_argument('--lamp', default='fluorescent', choices=sorted(REFERENCE_LAMPS))
+    parser.add_argument('--output', default='calibration.json')
+    parser.add_argument('--row', type=parse_row, default=SPECTRUM_ROW, help="row number, top:bottom or 'auto'")
+    parser.add_argument('--degree', type=int, default=2)
+    parser.add_argument('--tolerance', type=float, default=3.0)
+    args = parser.parse_args(argv)
+    calibration = auto_calibrate(decode_intensity(args.image, args.row), args.lamp, args.degree, args.tolerance)
+    calibration.save(args.output)
+    print(f"Matched {len(calibration.pixel_positions)} lines, calibration saved to '{args.output}'.")
+    print(calibration)
+
+
+if __name__ == '__main__':
+    main()
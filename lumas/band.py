@@ -0,0 +1,48 @@
+#SPECTRUM BAND EXTRACTION
+#Finds the brightest horizontal band of the capture and integrates intensity over all
+#of its rows, using integer reductions on views of the uint8 image (no float copy)
+
+#Libraries
+import numpy as np
+
+
+#Total brightness of every row, from every column_step-th column (strided view, integer sum)
+def row_energy(image_array, column_step=4):
+    columns = image_array[:, ::column_step]
+    axes = (1, 2) if columns.ndim == 3 else 1
+    return columns.sum(axis=axes, dtype=np.uint64)
+
+
+#(top, bottom) rows of the brightest band: the run of rows around the brightest one whose
+#energy stays above background + level * (peak - background), background being the median row
+def find_spectrum_band(image_array, level=0.5, column_step=4, smoothing_rows=5):
+    return band_from_energy(row_energy(image_array, column_step), level, smoothing_rows)
+
+
+#Same band search on an already computed row-energy profile
+def band_from_energy(energy, level=0.5, smoothing_rows=5):
+    energy = np.asarray(energy, dtype=float)
+    if smoothing_rows > 1 and len(energy) >= smoothing_rows:
+        energy = np.convolve(energy, np.ones(smoothing_rows) / smoothing_rows, mode='same')
+
+    peak = int(np.argmax(energy))
+    background = np.median(energy)
+    outside = np.flatnonzero(energy < background + level * (energy[peak] - background))
+    above = outside[outside < peak]
+    below = outside[outside > peak]
+    top = int(above[-1]) + 1 if len(above) else 0
+    bottom = int(below[0]) if len(below) else len(energy)
+    return top, bottom
+
+
+#Mean over the band's rows (and RGB channels) for every column, same 0-255 scale as one row
+def band_intensity(image_array, band):
+    top, bottom = band
+    region = image_array[top:bottom]
+    #Rows first (contiguous, uint32 cannot overflow below ~5.6 million rows of uint8), then channels
+    total = region.sum(axis=0, dtype=np.uint32)
+    count = region.shape[0]
+    if region.ndim == 3:
+        total = total.sum(axis=1, dtype=np.uint64)
+        count *= region.shape[2]
+    return total / count
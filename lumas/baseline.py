@@ -0,0 +1,107 @@
+#BASELINE REMOVAL AND ADAPTIVE PEAK THRESHOLD
+#The continuum under the lines is estimated and removed, and a peak has to rise a few
+#local noise levels above it, so weak lines on a bright continuum are found while flat,
+#noisy regions produce no peaks. Everything runs in linear time in the spectrum width.
+
+#Libraries
+import numpy as np
+from scipy.linalg.lapack import dpbsv
+from scipy.ndimage import maximum_filter1d, median_filter, minimum_filter1d, uniform_filter1d
+
+#'als': asymmetric least squares (Eilers), follows curved continua closely
+#'rolling-min': minimum then maximum filter (an opening) smoothed by a moving average, faster
+BASELINE_METHODS = ('als', 'rolling-min')
+
+#ALS settings: smoothness (larger = stiffer baseline) and weight of points above the baseline
+ALS_SMOOTHNESS = 1e5
+ALS_ASYMMETRY = 0.01
+ALS_ITERATIONS = 10
+
+#Rolling-min window in pixels, several times the width of a line
+ROLLING_WINDOW = 51
+
+#Window in pixels over which the local noise level is estimated
+NOISE_WINDOW = 101
+
+#Scale from the median absolute deviation to the standard deviation of Gaussian noise
+MAD_TO_STD = 1.4826
+
+#Second-difference penalty D'D per (width, smoothness), in LAPACK upper banded storage
+_penalties = {}
+
+
+def _penalty(n, smoothness):
+    key = (n, smoothness)
+    bands = _penalties.get(key)
+    if bands is None:
+        bands = np.zeros((3, n))
+        bands[0, 2:] = 1
+        bands[1, 1:] = -4
+        bands[1, 1] = bands[1, -1] = -2
+        bands[2] = 6
+        bands[2, 0] = bands[2, -1] = 1
+        bands[2, 1] = bands[2, -2] = 5
+        bands *= smoothness
+        _penalties[key] = bands
+    return bands
+
+
+#Asymmetric least squares baseline: a smooth curve that points above it (the lines) barely pull up
+#Each iteration solves one pentadiagonal system (banded Cholesky, linear in the width), stopping
+#once at most one weight in a thousand still flips between iterations
+#weights: starting weights (e.g. the previous frame's, the fit then settles in a solve or two),
+#returned for reuse
+def als_baseline(intensity, smoothness=ALS_SMOOTHNESS, asymmetry=ALS_ASYMMETRY, iterations=ALS_ITERATIONS,
+                 weights=None):
+    intensity = np.asarray(intensity, dtype=float)
+    n = len(intensity)
+    if n < 3:
+        return intensity.copy(), np.ones(n)
+    penalty = _penalty(n, smoothness)
+    weights = np.ones(n) if weights is None or len(weights) != n else weights
+    for _ in range(iterations):
+        bands = penalty.copy()
+        bands[2] += weights
+        _, baseline, info = dpbsv(bands, weights * intensity, overwrite_ab=1, overwrite_b=1)
+        if info != 0:
+            raise np.linalg.LinAlgError(f"ALS baseline system is not positive definite (info {info}).")
+        new_weights = np.where(intensity > baseline, asymmetry, 1 - asymmetry)
+        settled = np.count_nonzero(new_weights != weights) <= n // 1000
+        weights = new_weights
+        if settled:
+            break
+    return baseline, weights
+
+
+#Morphological baseline: rolling minimum, rolling maximum of that (so the baseline is not
+#lower than it needs to be), then a moving average to round off the steps
+def rolling_min_baseline(intensity, window=ROLLING_WINDOW):
+    intensity = np.asarray(intensity, dtype=float)
+    opened = maximum_filter1d(minimum_filter1d(intensity, window, mode='nearest'), window, mode='nearest')
+    return np.minimum(uniform_filter1d(opened, window, mode='nearest'), intensity)
+
+
+def estimate_baseline(intensity, method='als'):
+    if method == 'als':
+        return als_baseline(intensity)[0]
+    if method == 'rolling-min':
+        return rolling_min_baseline(intensity)
+    raise ValueError(f"Unknown baseline method '{method}', use one of {', '.join(BASELINE_METHODS)}.")
+
+
+#Noise level (standard deviation) around every pixel, from the residual of the smoothing
+#Never below half the whole spectrum's level, so clipped or perfectly flat stretches do not
+#get a zero threshold
+def local_noise(intensity, smoothed_intensity, window=NOISE_WINDOW):
+    deviation = np.abs(np.asarray(intensity, dtype=float) - smoothed_intensity)
+    noise = MAD_TO_STD * median_filter(deviation, min(window, len(deviation)), mode='reflect')
+    floor = max(0.5 * MAD_TO_STD * np.median(deviation), 1e-6 * np.ptp(smoothed_intensity), 1e-12)
+    return np.maximum(noise, floor)
+
+
+#Per-pixel peak threshold: baseline of the smoothed spectrum plus noise_factor local noise levels
+#Returns (threshold, baseline, noise)
+def adaptive_threshold(intensity, smoothed_intensity, noise_factor=3.0, method='als'):
+    baseline = estimate_baseline(smoothed_intensity, method)
+    noise = local_noise(intensity, smoothed_intensity)
+    return baseline + noise_factor * noise, baseline, noise
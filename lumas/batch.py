@@ -0,0 +1,175 @@
+#BATCH FOLDER ANALYSIS
+#Works through every pending image in a folder with a process pool and writes one
+#summary row per image, images only move to 'processed' after their row is written
+
+#Libraries
+import argparse
+import csv
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from .calibration import load_calibration
+from .accumulate import load_correction
+from .archive import SpectrumArchive
+from .pipeline import SPECTRUM_ROW, analyse_image, parse_row
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+SUMMARY_FIELDS = ['image', 'peak_count', 'peak_wavelengths', 'peak_intensities', 'elements', 'error']
+
+
+#Image files waiting in the folder, oldest first (one scandir pass, only the images are stat'ed for
+#their ctime)
+def pending_images(folder):
+    entries = [entry for entry in os.scandir(folder)
+               if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS)]
+    entries.sort(key=lambda entry: entry.stat().st_ctime)
+    return [entry.path for entry in entries]
+
+
+#Flatten a SpectrumResult into one summary row
+#Lists are ';' separated per peak, matches inside a peak are '|' separated
+def summary_row(image_path, result):
+    return {
+        'image': os.path.basename(image_path),
+        'peak_count': len(result.peaks),
+        'peak_wavelengths': ';'.join(f'{wl:.2f}' for wl in result.peak_wavelengths),
+        'peak_intensities': ';'.join(f'{value:.2f}' for value in result.peak_intensities),
+        'elements': ';'.join('|'.join(f'{el}:{wl}' for el, wl in elements) for elements in result.elements),
+        'error': '',
+    }
+
+
+#Worker: decode, smoothing, peak detection and element matching for one file
+#Only the small summary row goes back to the parent process, plus the SpectrumResult
+#(None on error) as (summary, result) with keep_result, e.g. for the archive
+def analyse_file(image_path, tolerance=2, row=SPECTRUM_ROW, calibration=None, correction=None, keep_result=False):
+    try:
+        result = analyse_image(image_path, tolerance=tolerance, row=row, calibration=calibration,
+                               correction=correction)
+    except Exception as e:
+        summary = dict.fromkeys(SUMMARY_FIELDS, '') | {'image': os.path.basename(image_path), 'peak_count': None,
+                                                       'error': str(e)}
+        return (summary, None) if keep_result else summary
+    summary = summary_row(image_path, result)
+    return (summary, result) if keep_result else summary
+
+
+#Open a summary CSV for appending, writing the header if the file is new
+def open_summary_csv(output_path):
+    write_header = not os.path.exists(output_path) or os.path.getsize(output_path) == 0
+    f = open(output_path, 'a', newline='')
+    writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+    if write_header:
+        writer.writeheader()
+    return f, writer
+
+
+#Appends each (summary, result) to the archive and passes the summary on
+def _archived(results, image_paths, store):
+    for image_path, (summary, result) in zip(image_paths, results):
+        if result is not None:
+            store.append(result, os.path.basename(image_path), os.path.getmtime(image_path))
+        yield summary
+
+
+def move_to_processed(image_path, processed_folder):
+    shutil.move(image_path, os.path.join(processed_folder, os.path.basename(image_path)))
+
+
+#pyarrow and pyarrow.parquet, with a hint when they are missing
+def _import_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet output needs pyarrow, install it or use a .csv summary") from None
+    return pa, pq
+
+
+#Parquet files cannot be appended to: rows of earlier runs are read back and the file is
+#replaced with old + new rows (written to a temporary file first so a failed write loses nothing)
+def _write_parquet(rows, output_path):
+    pa, pq = _import_pyarrow()
+    schema = pa.schema([(field, pa.int64() if field == 'peak_count' else pa.string()) for field in SUMMARY_FIELDS])
+    table = pa.Table.from_pylist(rows, schema=schema)
+    if os.path.exists(output_path):
+        table = pa.concat_tables([pq.read_table(output_path).select(SUMMARY_FIELDS).cast(schema), table])
+    temporary_path = output_path + '.tmp'
+    pq.write_table(table, temporary_path)
+    os.replace(temporary_path, output_path)
+
+
+#Analyse every pending image in folder
+#Summary goes to a CSV (appended row by row) or, for a .parquet path, to a Parquet file
+#With archive (a folder) every analysed spectrum is also appended to a SpectrumArchive
+#Returns the summary rows; failed images are reported and left in place
+def run_batch(folder, output_path=None, workers=None, tolerance=2, row=SPECTRUM_ROW, calibration=None, chunksize=4,
+              correction=None, archive=None):
+    image_paths = pending_images(folder)
+    if not image_paths:
+        print("No new images found.")
+        return []
+
+    if output_path is None:
+        output_path = os.path.join(folder, 'summary.csv')
+    parquet = output_path.endswith('.parquet')
+    if parquet:
+        #Fail before the pool runs, not after every image has been analysed
+        _import_pyarrow()
+    processed_folder = os.path.join(folder, 'processed')
+    os.makedirs(processed_folder, exist_ok=True)
+
+    rows = []
+    store = SpectrumArchive(archive) if archive else None
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        worker = partial(analyse_file, tolerance=tolerance, row=row, calibration=calibration, correction=correction,
+                         keep_result=store is not None)
+        results = pool.map(worker, image_paths, chunksize=chunksize)
+        if store is not None:
+            results = _archived(results, image_paths, store)
+        if parquet:
+            rows = list(results)
+            _write_parquet(rows, output_path)
+            for image_path, summary in zip(image_paths, rows):
+                if not summary['error']:
+                    move_to_processed(image_path, processed_folder)
+        else:
+            f, writer = open_summary_csv(output_path)
+            with f:
+                for image_path, summary in zip(image_paths, results):
+                    writer.writerow(summary)
+                    f.flush()
+                    rows.append(summary)
+                    #Row is on disk, the image can be moved now
+                    if not summary['error']:
+                        move_to_processed(image_path, processed_folder)
+
+    if store is not None:
+        store.close()
+    for summary in rows:
+        if summary['error']:
+            print(f"Error: {summary['image']}: {summary['error']}")
+    print(f"Processed {len(rows)} images, summary written to '{output_path}'.")
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse every pending image in a folder.")
+    parser.add_argument('folder')
+    parser.add_argument('--output', help="summary file (.csv or .parquet), default <folder>/summary.csv")
+    parser.add_argument('--workers', type=int, default=None, help="process pool size, default one per CPU")
+    parser.add_argument('--tolerance', type=float, default=2)
+    parser.add_argument('--row', type=parse_row, default=SPECTRUM_ROW, help="row number, top:bottom or 'auto'")
+    parser.add_argument('--calibration', help="saved calibration file, default the built-in calibration")
+    parser.add_argument('--correction', help="dark-frame / flat-field file from python -m lumas.accumulate")
+    parser.add_argument('--archive', help="spectrum archive folder to append every analysed spectrum to")
+    args = parser.parse_args(argv)
+    run_batch(args.folder, args.output, args.workers, args.tolerance, args.row, load_calibration(args.calibration),
+              correction=load_correction(args.correction), archive=args.archive)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#WAVELENGTH CALIBRATION
+
+#Libraries
+import json
+
+import numpy as np
+
+#Pixel positions of known peaks and their wavelengths in nanometers (change as per your setup)
+known_pixel_positions = [100, 500, 800, 1200]
+known_wavelengths = [400, 500, 600, 700]
+
+
+#Polynomial pixel -> wavelength calibration
+#The wavelength axis only depends on the image width, so it is computed once per
+#width and reused, together with the axis in rising order the inverse mapping interpolates on
+class Calibration:
+    def __init__(self, pixel_positions, wavelengths, degree=2):
+        self.pixel_positions = [float(p) for p in pixel_positions]
+        self.wavelengths = [float(wl) for wl in wavelengths]
+        self.degree = degree
+        self.coefficients = np.polyfit(self.pixel_positions, self.wavelengths, degree)
+        self._axes = {}
+
+    def __repr__(self):
+        return f"Calibration({self.pixel_positions}, {self.wavelengths}, degree={self.degree})"
+
+    #Convert pixel position to wavelength using the polynomial fit
+    def pixel_to_wavelength(self, pixel):
+        return np.polyval(self.coefficients, pixel)
+
+    #(axis, rising wavelengths, their pixels) for a width; the last two are None when the
+    #axis is not monotonic over that width
+    def _cached_axis(self, width):
+        cached = self._axes.get(width)
+        if cached is None:
+            axis = self.pixel_to_wavelength(np.arange(width))
+            axis.setflags(write=False)
+            pixels = np.arange(width, dtype=float)
+            steps = np.diff(axis)
+            if np.all(steps >= 0):
+                cached = (axis, axis, pixels)
+            elif np.all(steps <= 0):
+                cached = (axis, axis[::-1], pixels[::-1])
+            else:
+                cached = (axis, None, None)
+            self._axes[width] = cached
+        return cached
+
+    #Wavelength of every pixel column in an image of the given width (read-only, cached)
+    def axis(self, width):
+        return self._cached_axis(width)[0]
+
+    #Fractional pixel position of each wavelength on an image of the given width
+    def wavelength_to_pixel(self, wavelength, width):
+        axis, rising, pixels = self._cached_axis(width)
+        wavelength = np.asarray(wavelength, dtype=float)
+        if rising is None:
+            #Not monotonic over this width, fall back to the nearest pixel
+            return np.abs(axis - wavelength[..., None]).argmin(axis=-1).astype(float)
+        return np.interp(wavelength, rising, pixels)
+
+    def to_dict(self):
+        return {'pixel_positions': self.pixel_positions, 'wavelengths': self.wavelengths, 'degree': self.degree}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['pixel_positions'], data['wavelengths'], data.get('degree', 2))
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+default_calibration = Calibration(known_pixel_positions, known_wavelengths)
+
+
+#Saved calibration if a path is given, otherwise the built-in one
+def load_calibration(path=None):
+    if path is None:
+        return default_calibration
+    return Calibration.load(path)
+
+
+#Convert pixel position to wavelength with the built-in calibration
+def pixel_to_wavelength(pixel):
+    return default_calibration.pixel_to_wavelength(pixel)
+
+
+#Wavelength of every pixel column with the built-in calibration
+def wavelength_axis(width):
+    return default_calibration.axis(width)
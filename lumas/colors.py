@@ -0,0 +1,53 @@
+#SPECTRUM COLOR MAP
+
+#Libraries
+import numpy as np
+
+#Visible range used by the color map, anything outside is clamped to the edges
+_MIN_WAVELENGTH = 380
+_MAX_WAVELENGTH = 700
+
+#Cache of color arrays keyed by wavelength axis, the axis only changes with the
+#image width or the calibration so repeated plots skip the mapping entirely
+_color_table = {}
+_COLOR_TABLE_SIZE = 16
+
+
+#Scalar version, kept for callers that map a single wavelength
+def wavelength_to_rgb(wavelength):
+    r, g, b = wavelengths_to_rgb(np.array([wavelength], dtype=float))[0]
+    return (float(r), float(g), float(b))
+
+
+#Vectorized color map, same piecewise formulas (and branch order) as the
+#original per-pixel function so every channel matches bit for bit
+def wavelengths_to_rgb(wavelengths):
+    wl = np.clip(np.asarray(wavelengths, dtype=float), _MIN_WAVELENGTH, _MAX_WAVELENGTH)
+    conditions = [
+        (380 <= wl) & (wl <= 440),
+        (440 <= wl) & (wl <= 490),
+        (490 <= wl) & (wl <= 510),
+        (510 <= wl) & (wl <= 580),
+        (580 <= wl) & (wl <= 645),
+        (645 <= wl) & (wl <= 700),
+    ]
+    zero = np.zeros_like(wl)
+    one = np.ones_like(wl)
+    r = np.select(conditions, [-(wl - 440) / (440 - 380), zero, zero, (wl - 510) / (580 - 510), one, one], 0.0)
+    g = np.select(conditions, [zero, (wl - 440) / (490 - 440), one, one, -(wl - 645) / (645 - 580), zero], 0.0)
+    b = np.select(conditions, [one, one, -(wl - 510) / (510 - 490), zero, zero, zero], 0.0)
+    return np.stack([r, g, b], axis=-1)
+
+
+#Colors for a whole wavelength axis, looked up from the cache when the axis was seen before
+def spectrum_colors(wavelengths):
+    wavelengths = np.ascontiguousarray(wavelengths, dtype=float)
+    key = wavelengths.tobytes()
+    colors = _color_table.get(key)
+    if colors is None:
+        if len(_color_table) >= _COLOR_TABLE_SIZE:
+            _color_table.pop(next(iter(_color_table)))
+        colors = wavelengths_to_rgb(wavelengths)
+        colors.setflags(write=False)
+        _color_table[key] = colors
+    return colors
@@ -0,0 +1,68 @@
+#FRAME DECODING
+#Low-memory decode paths: only the spectrum rows are ever turned into arrays, and
+#intensity is accumulated with integer sums instead of float copies of the image
+
+#Libraries
+import io
+
+import numpy as np
+from PIL import Image
+
+from .band import band_from_energy, band_intensity
+
+#Rows of the live frame that hold the spectrum (adjust ROI)
+ROI_TOP = 100
+ROI_BOTTOM = 200
+
+#Columns kept in the reduced row-energy preview used to find the band
+_PROFILE_COLUMNS = 64
+
+
+#Rows of the decoded PIL image that hold the spectrum: a row number, (top, bottom) or 'auto'
+#'auto' finds the band on a column-reduced copy made by Image.reduce (H x 64 pixels)
+def _spectrum_band(image, row):
+    if isinstance(row, str):
+        if row != 'auto':
+            raise ValueError(f"Unknown spectrum row '{row}', use a row number, (top, bottom) or 'auto'.")
+        preview = image.reduce((max(1, image.width // _PROFILE_COLUMNS), 1))
+        profile = np.asarray(preview)
+        return band_from_energy(profile.reshape(profile.shape[0], -1).sum(axis=1, dtype=np.uint64))
+    if isinstance(row, (tuple, list)):
+        return tuple(row)
+    return row, row + 1
+
+
+#Intensity of the spectrum row/band of an image file or file-like object
+#Same values as row_intensity(load_image_array(source), row), but the image is never
+#copied to a full numpy array or converted to float: only the band rows are cropped
+def decode_intensity(source, row):
+    with Image.open(source) as image:
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        else:
+            image.load()
+        top, bottom = _spectrum_band(image, row)
+        region = np.asarray(image.crop((0, top, image.width, bottom)))
+    return band_intensity(region, (0, bottom - top))
+
+
+#Turns encoded frames into intensity vectors: crop the spectrum rows, convert only
+#those to grayscale and average them with an integer sum, writing into one float
+#buffer that is reused while the width is unchanged
+#The returned array is overwritten by the next call, copy it to keep it
+class FrameDecoder:
+    def __init__(self, top=ROI_TOP, bottom=ROI_BOTTOM):
+        self.top = top
+        self.bottom = bottom
+        self._intensity = None
+
+    def intensity(self, data):
+        with Image.open(io.BytesIO(data)) as image:
+            gray_region = image.crop((0, self.top, image.width, self.bottom)).convert("L")
+        spectrum_region = np.asarray(gray_region)
+
+        width = spectrum_region.shape[1]
+        if self._intensity is None or len(self._intensity) != width:
+            self._intensity = np.empty(width)
+        total = spectrum_region.sum(axis=0, dtype=np.uint32)
+        return np.divide(total, spectrum_region.shape[0], out=self._intensity)
@@ -0,0 +1,9 @@
+#ELEMENT LINE TABLE
+#The lines are kept in lumas/data/lines.csv (see lumas/linedb.py), edit that file to add
+#elements, lines or relative intensities
+
+#Libraries
+from .linedb import default_line_table
+
+#Elements with their wavelengths (nm)
+element_data = default_line_table().element_data()
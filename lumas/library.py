@@ -0,0 +1,180 @@
+#SPECTRUM LIBRARY
+#Reference spectra of known materials, resampled onto one wavelength grid and normalised,
+#so a new capture is identified by one matrix-vector product over the whole library
+
+#Libraries
+import argparse
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from .calibration import load_calibration
+from .pipeline import SPECTRUM_ROW, analyse_image, parse_row
+
+#Wavelength grid (nm) every stored spectrum is resampled to
+GRID_START = 380.0
+GRID_STOP = 750.0
+GRID_STEP = 1.0
+
+#'cosine' compares spectral shape including its offset, 'correlation' removes each spectrum's mean first
+SIMILARITY_METHODS = ('cosine', 'correlation')
+
+Match = namedtuple('Match', ['name', 'similarity', 'index'])
+
+
+#np.savez adds '.npz' to a path without it, so saving and loading both use that name
+def library_path(path):
+    path = os.fspath(path)
+    return path if path.endswith('.npz') else path + '.npz'
+
+
+def default_grid():
+    return np.arange(GRID_START, GRID_STOP + GRID_STEP / 2, GRID_STEP)
+
+
+#Reference spectra as rows of a preallocated float32 matrix (capacity doubles when full)
+#Rows are stored normalised, so similarity to a query is a dot product
+class SpectrumLibrary:
+    def __init__(self, grid=None, method='cosine', capacity=1024):
+        if method not in SIMILARITY_METHODS:
+            raise ValueError(f"Unknown similarity '{method}', use one of {', '.join(SIMILARITY_METHODS)}.")
+        self.grid = default_grid() if grid is None else np.asarray(grid, dtype=float)
+        self.method = method
+        self.matrix = np.zeros((capacity, len(self.grid)), dtype=np.float32)
+        self.names = []
+        self.index = None
+
+    def __len__(self):
+        return len(self.names)
+
+    #Resampled, normalised vector for a calibrated spectrum (zero outside its wavelength range)
+    def vector(self, wavelengths, intensity):
+        wavelengths = np.asarray(wavelengths, dtype=float)
+        intensity = np.asarray(intensity, dtype=float)
+        if wavelengths[0] > wavelengths[-1]:
+            wavelengths, intensity = wavelengths[::-1], intensity[::-1]
+        vector = np.interp(self.grid, wavelengths, intensity, left=0.0, right=0.0)
+        if self.method == 'correlation':
+            vector -= vector.mean()
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            raise ValueError("The spectrum is flat over the library's wavelength grid.")
+        return vector / norm
+
+    def add(self, name, wavelengths, intensity):
+        if len(self.names) == len(self.matrix):
+            grown = np.zeros((2 * len(self.matrix), len(self.grid)), dtype=np.float32)
+            grown[:len(self.matrix)] = self.matrix
+            self.matrix = grown
+        self.matrix[len(self.names)] = self.vector(wavelengths, intensity)
+        self.names.append(name)
+        self.index = None
+        return len(self.names) - 1
+
+    #Stores the smoothed spectrum of a SpectrumResult
+    def add_result(self, name, result):
+        return self.add(name, result.wavelengths, result.smoothed_intensity)
+
+    #Top k library spectra by similarity (1 = same shape), best first
+    def search(self, wavelengths, intensity, k=5):
+        query = self.vector(wavelengths, intensity).astype(np.float32)
+        count = len(self.names)
+        if not count:
+            return []
+        k = min(k, count)
+        if self.index is not None:
+            candidates = self.index.candidates(query, k)
+            similarity = self.matrix[candidates] @ query
+        else:
+            candidates = None
+            similarity = self.matrix[:count] @ query
+        top = np.argpartition(-similarity, k - 1)[:k] if k < len(similarity) else np.arange(len(similarity))
+        top = top[np.argsort(-similarity[top])]
+        rows = candidates[top] if candidates is not None else top
+        return [Match(self.names[row], float(similarity[i]), int(row)) for i, row in zip(top.tolist(), rows.tolist())]
+
+    def search_result(self, result, k=5):
+        return self.search(result.wavelengths, result.smoothed_intensity, k)
+
+    #PCA-reduced index for large libraries: searches score all rows in `components` dimensions,
+    #then rescore the best `oversample * k` exactly; rebuilt after spectra are added
+    def build_index(self, components=32, oversample=20, sample_size=20000):
+        self.index = PCAIndex(self.matrix[:len(self.names)], components, oversample, sample_size)
+        return self.index
+
+    def save(self, path):
+        np.savez(library_path(path), matrix=self.matrix[:len(self.names)], names=np.array(self.names, dtype=str),
+                 grid=self.grid, method=np.array(self.method))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(library_path(path)) as data:
+            matrix = data['matrix']
+            library = cls(data['grid'], str(data['method']), capacity=max(len(matrix), 1))
+            library.matrix[:len(matrix)] = matrix
+            library.names = data['names'].tolist()
+        return library
+
+
+#Principal components of the library rows (fitted on a random sample), with every row projected
+class PCAIndex:
+    def __init__(self, matrix, components=32, oversample=20, sample_size=20000, seed=0):
+        self.oversample = oversample
+        sample = matrix
+        if len(matrix) > sample_size:
+            sample = matrix[np.random.default_rng(seed).choice(len(matrix), sample_size, replace=False)]
+        self.mean = sample.mean(axis=0)
+        _, _, vt = np.linalg.svd(sample - self.mean, full_matrices=False)
+        self.basis = np.ascontiguousarray(vt[:components].T, dtype=np.float32)  #grid x components
+        self.projected = (matrix - self.mean) @ self.basis
+
+    #Rows worth an exact score: x . q is approximated by projected(x) . (basis^T q) + mean . q,
+    #the constant term does not change the order so it is left out
+    def candidates(self, query, k):
+        approximate = self.projected @ (query @ self.basis)
+        count = min(len(approximate), self.oversample * k)
+        if count >= len(approximate):
+            return np.arange(len(approximate))
+        return np.argpartition(-approximate, count - 1)[:count]
+
+
+#Print the closest library materials to a SpectrumResult, one line each
+def print_library_matches(library, result, k=3):
+    for match in library.search_result(result, k):
+        print(f"Library match: {match.name} (similarity {match.similarity:.3f})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Store reference spectra and match captures against them.")
+    parser.add_argument('command', choices=('add', 'match'))
+    parser.add_argument('library', help="library file (.npz), created by the first 'add'")
+    parser.add_argument('images', nargs='+')
+    parser.add_argument('--name', help="material name for 'add', default the image file name")
+    parser.add_argument('-k', type=int, default=5, help="matches to show for 'match'")
+    parser.add_argument('--method', default='cosine', choices=SIMILARITY_METHODS, help="for a new library")
+    parser.add_argument('--row', type=parse_row, default=SPECTRUM_ROW, help="row number, top:bottom or 'auto'")
+    parser.add_argument('--calibration', help="saved calibration file, default the built-in calibration")
+    args = parser.parse_args(argv)
+    calibration = load_calibration(args.calibration)
+
+    path = library_path(args.library)
+    if args.command == 'add':
+        if os.path.exists(path):
+            library = SpectrumLibrary.load(path)
+        else:
+            library = SpectrumLibrary(method=args.method)
+        for image in args.images:
+            library.add_result(args.name or image, analyse_image(image, row=args.row, calibration=calibration))
+        library.save(path)
+        print(f"Library '{path}' now holds {len(library)} spectra.")
+    else:
+        library = SpectrumLibrary.load(path)
+        for image in args.images:
+            print(f"{image}:")
+            for match in library.search_result(analyse_image(image, row=args.row, calibration=calibration), args.k):
+                print(f"    {match.name}: {match.similarity:.3f}")
+
+
+if __name__ == '__main__':
+    main()
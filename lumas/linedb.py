@@ -0,0 +1,174 @@
+#SPECTRAL LINE DATABASE
+#The element lines live in a versioned text file (lumas/data/lines.csv, or a JSON file with
+#the same columns). The first load compiles it into a columnar binary cache (a one-line JSON
+#header followed by the raw arrays), later loads only read the cache, so large tables do not
+#slow down startup.
+
+#Libraries
+import csv
+import hashlib
+import json
+import os
+import tempfile
+import warnings
+
+import numpy as np
+
+LINES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'lines.csv')
+
+#Bump when the cache layout changes, old caches are then recompiled
+CACHE_FORMAT = 1
+
+
+#Compiled line table: parallel arrays with one entry per line, grouped by element in file order
+class LineTable:
+    def __init__(self, elements, element_ids, wavelengths, intensities, version=''):
+        self.elements = list(elements)
+        self.element_ids = np.asarray(element_ids, dtype=np.int32)
+        self.wavelengths = np.asarray(wavelengths, dtype=float)
+        self.intensities = np.asarray(intensities, dtype=float)
+        self.version = version
+
+    def __len__(self):
+        return len(self.wavelengths)
+
+    #element -> [wavelength, ...], the form LineIndex and ElementScorer take
+    def element_data(self):
+        return self._grouped(self.wavelengths)
+
+    #element -> [relative intensity, ...] in the same order as element_data()
+    def line_weights(self):
+        return self._grouped(self.intensities)
+
+    def _grouped(self, values):
+        bounds = np.searchsorted(self.element_ids, np.arange(len(self.elements) + 1))
+        values = values.tolist()
+        return {element: values[bounds[i]:bounds[i + 1]] for i, element in enumerate(self.elements)}
+
+
+#Rows of (element, wavelength, relative intensity) and the version from a CSV or JSON line file
+#CSV: '# version: 1' style comment lines, then element,wavelength_nm,relative_intensity
+#A missing relative intensity reads as 1.0
+#JSON: {"version": "1", "lines": [{"element": ..., "wavelength_nm": ..., "relative_intensity": ...}]}
+def _read_rows(path):
+    if path.lower().endswith('.json'):
+        with open(path) as f:
+            data = json.load(f)
+        lines = data['lines']
+        version = str(data.get('version', ''))
+    else:
+        version = ''
+        with open(path, newline='') as f:
+            rows = []
+            for line in f:
+                if line.startswith('#'):
+                    key, _, value = line[1:].partition(':')
+                    if key.strip() == 'version':
+                        version = value.strip()
+                elif line.strip():
+                    rows.append(line)
+        lines = csv.DictReader(rows)
+    return [(line['element'].strip(), float(line['wavelength_nm']), float(line.get('relative_intensity') or 1.0))
+            for line in lines], version
+
+
+#Parse a line file into a LineTable
+#Elements keep their first-seen order, a line listed twice for the same element is kept once
+#(with the larger relative intensity)
+def read_line_file(path):
+    rows, version = _read_rows(path)
+    lines = {}
+    for element, wavelength, intensity in rows:
+        element_lines = lines.setdefault(element, {})
+        element_lines[wavelength] = max(intensity, element_lines.get(wavelength, intensity))
+
+    elements = list(lines)
+    element_ids = [i for i, element in enumerate(elements) for _ in lines[element]]
+    wavelengths = [wl for element in elements for wl in lines[element]]
+    intensities = [value for element in elements for value in lines[element].values()]
+    return LineTable(elements, element_ids, wavelengths, intensities, version)
+
+
+#Where the compiled cache of a line file goes: LUMAS_CACHE_DIR, else the user cache folder
+#The file name includes a hash of the source path so different tables never share a cache
+def cache_path(path):
+    folder = os.environ.get('LUMAS_CACHE_DIR') or os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'lumas')
+    key = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:12]
+    return os.path.join(folder, f"{os.path.splitext(os.path.basename(path))[0]}-{key}.bin")
+
+
+#Source file fingerprint stored in the cache, a changed file recompiles
+def _source_key(path):
+    stat = os.stat(path)
+    return [CACHE_FORMAT, stat.st_size, stat.st_mtime_ns]
+
+
+#Cache layout: JSON header line, then element_ids (int32), wavelengths and intensities (float64)
+def _load_cache(path, source_key):
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        end = data.index(b'\n')
+        header = json.loads(data[:end])
+        if header['source_key'] != source_key:
+            return None
+        count = header['count']
+        offset = end + 1
+        element_ids = np.frombuffer(data, np.int32, count, offset)
+        wavelengths = np.frombuffer(data, np.float64, count, offset + 4 * count)
+        intensities = np.frombuffer(data, np.float64, count, offset + 12 * count)
+        return LineTable(header['elements'], element_ids, wavelengths, intensities, header['version'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+#Written to a temporary file first so a concurrent reader never sees half a cache
+def _save_cache(path, table, source_key):
+    header = {'source_key': source_key, 'version': table.version, 'elements': table.elements, 'count': len(table)}
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.bin')
+    except OSError:
+        #A read-only cache folder only costs the parse on every start
+        return
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(json.dumps(header).encode() + b'\n')
+            f.write(table.element_ids.astype(np.int32).tobytes())
+            f.write(table.wavelengths.astype(np.float64).tobytes())
+            f.write(table.intensities.astype(np.float64).tobytes())
+        os.replace(tmp, path)
+    except OSError:
+        os.remove(tmp)
+
+
+#Line table from a line file (default: lumas/data/lines.csv), through the compiled cache
+#Warns when every line has the same relative intensity: the column is then a placeholder and
+#the scorer weighs all lines alike
+def load_line_table(path=None, use_cache=True):
+    path = path or LINES_FILE
+    if use_cache:
+        source_key = _source_key(path)
+        cached = cache_path(path)
+        table = _load_cache(cached, source_key)
+        if table is None:
+            table = read_line_file(path)
+            _save_cache(cached, table, source_key)
+    else:
+        table = read_line_file(path)
+    if len(table) > 1 and np.all(table.intensities == table.intensities[0]):
+        warnings.warn(f"All lines in '{path}' have the same relative intensity, the line weights are "
+                      f"placeholders.", stacklevel=2)
+    return table
+
+
+#Table behind element_data, the default line index and the default scorer, loaded on first use
+_default_table = None
+
+
+def default_line_table():
+    global _default_table
+    if _default_table is None:
+        _default_table = load_line_table()
+    return _default_table
@@ -0,0 +1,93 @@
+#SPECTRAL LINE INDEX
+
+#Libraries
+import numpy as np
+
+#Small widening of the searchsorted window so float rounding at the edges
+#never drops a line that the exact abs() test below would keep
+_EDGE = 1e-9
+
+
+#Flat, sorted view of an element_data table
+#Answers "which lines lie within tolerance of these peaks" for a whole vector of
+#peaks with two searchsorted calls instead of a loop over every element and line
+class LineIndex:
+    def __init__(self, element_data):
+        names = []
+        values = []
+        element_ids = []
+        for element_id, (element, wavelengths) in enumerate(element_data.items()):
+            names.append(element)
+            for wl in wavelengths:
+                values.append(wl)
+                element_ids.append(element_id)
+
+        #Position of each line in element_data order, used to give results back
+        #in the same order as the old nested loop
+        positions = np.arange(len(values))
+        order = np.argsort(np.asarray(values, dtype=float), kind='stable')
+
+        self.element_names = names
+        self.wavelengths = np.asarray(values, dtype=float)[order]
+        self.element_ids = np.asarray(element_ids, dtype=np.intp)[order]
+        self.positions = positions[order]
+        #Original table values (keeps ints as ints, e.g. "434 nm")
+        self.values = [values[i] for i in order]
+
+    def __len__(self):
+        return len(self.wavelengths)
+
+    #Vectorized tolerance query
+    #Returns (peak_ids, line_ids): line line_ids[k] is within tolerance of peak peak_ids[k],
+    #grouped by peak and in element_data order inside each peak
+    def match(self, peak_wavelengths, tolerance):
+        peaks = np.atleast_1d(np.asarray(peak_wavelengths, dtype=float))
+        lo = np.searchsorted(self.wavelengths, peaks - tolerance - _EDGE, side='left')
+        hi = np.searchsorted(self.wavelengths, peaks + tolerance + _EDGE, side='right')
+        counts = hi - lo
+
+        #Expand each [lo, hi) window into flat candidate indices
+        peak_ids = np.repeat(np.arange(len(peaks)), counts)
+        starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+        line_ids = starts + np.arange(counts.sum())
+
+        #Same test as the original loop: abs(wl - peak) <= tolerance
+        keep = np.abs(self.wavelengths[line_ids] - peaks[peak_ids]) <= tolerance
+        peak_ids = peak_ids[keep]
+        line_ids = line_ids[keep]
+
+        order = np.lexsort((self.positions[line_ids], peak_ids))
+        return peak_ids[order], line_ids[order]
+
+    #Matches for every peak as lists of (element, wavelength) tuples
+    def query(self, peak_wavelengths, tolerance):
+        peaks = np.atleast_1d(np.asarray(peak_wavelengths, dtype=float))
+        peak_ids, line_ids = self.match(peaks, tolerance)
+        bounds = np.searchsorted(peak_ids, np.arange(len(peaks) + 1))
+        names = self.element_names
+        element_ids = self.element_ids.tolist()
+        values = self.values
+        line_ids = line_ids.tolist()
+        return [[(names[element_ids[i]], values[i]) for i in line_ids[bounds[p]:bounds[p + 1]]]
+                for p in range(len(peaks))]
+
+    #Drop-in replacement for the old per-peak find_elements_near_peak
+    def find_elements_near_peak(self, peak_wavelength, tolerance):
+        return self.query([peak_wavelength], tolerance)[0]
+
+
+#Index over the shared element_data table, built on first use
+_default_index = None
+
+
+def default_line_index():
+    global _default_index
+    if _default_index is None:
+        from .elements import element_data
+        _default_index = LineIndex(element_data)
+    return _default_index
+
+
+#Elements with a line within ±tolerance nm of the peak wavelength
+def find_elements_near_peak(peak_wavelength, tolerance=10):
+    return default_line_index().find_elements_near_peak(peak_wavelength, tolerance)
@@ -0,0 +1,24 @@
+#LIVE FRAME ANALYSIS
+#The per-frame stages of the live analyser, shared by the wireless script and the replay
+#benchmark so both measure the same work
+
+#Libraries
+from .timing import timed
+
+
+#One encoded camera frame to a SpectrumResult: grayscale crop of the spectrum rows, dark-frame /
+#flat-field correction and frame stacking, then the StreamingProcessor (stabilization, smoothing,
+#peak detection and tracking, element matching for new or moved peaks only)
+#rolling: every frame updates the stack; otherwise one result per full stack and None while it fills
+#timer: optional StageTimer, records the decode and stack stages (the processor records its own)
+def process_frame(data, decoder, processor, stack, correction, rolling=True, timer=None):
+    with timed(timer, 'decode'):
+        intensity = decoder.intensity(data)
+    with timed(timer, 'stack'):
+        stack.add(correction.apply(intensity))
+        if not rolling and not stack.full:
+            return None
+        intensity = stack.value()
+        if not rolling:
+            stack.reset()
+    return processor.process(intensity)
@@ -0,0 +1,375 @@
+#MULTI-SOURCE LIVE ANALYSIS
+#Several spectrometer rigs in one process: every camera is fetched concurrently on one
+#asyncio event loop, decoding and analysis run on a shared thread pool (PIL decoding and
+#the NumPy/SciPy stages release the GIL), results are merged into one stream or dashboard
+
+#Libraries
+import argparse
+import asyncio
+import base64
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+
+from .calibration import Calibration, load_calibration
+from .decode import ROI_BOTTOM, ROI_TOP, FrameDecoder
+from .results import open_results, spectrum_record
+from .scoring import default_scorer
+from .stream import Frame, MJPEGParser
+from .streaming import StreamingProcessor
+
+STREAM_MODES = ('mjpeg', 'shot')
+
+
+#One camera endpoint with its own ROI and calibration
+#mode: 'mjpeg' for a continuous /video stream, 'shot' to poll single JPEGs (/shot.jpg)
+@dataclass
+class Source:
+    name: str
+    url: str
+    mode: str = 'mjpeg'
+    roi: tuple = (ROI_TOP, ROI_BOTTOM)
+    calibration: Calibration = None
+    tolerance: float = 10
+    stabilization_factor: float = 0.9
+
+
+#Sources from a JSON file, a list of objects (or {"sources": [...]}) such as
+#{"name": "rig-1", "url": "http://192.168.1.20:8080/video", "roi": [100, 200], "calibration": "rig-1.json"}
+#Relative calibration paths are taken from the folder of the sources file
+#Raises ValueError when the file lists no sources
+def load_sources(path):
+    with open(path) as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data['sources']
+    folder = os.path.dirname(os.path.abspath(path))
+    sources = []
+    for i, entry in enumerate(data):
+        entry = dict(entry)
+        mode = entry.get('mode', 'mjpeg')
+        if mode not in STREAM_MODES:
+            raise ValueError(f"Unknown stream mode '{mode}' for source {i}, use one of {', '.join(STREAM_MODES)}.")
+        calibration = entry.pop('calibration', None)
+        if calibration is not None:
+            calibration = load_calibration(os.path.join(folder, calibration))
+        entry['roi'] = tuple(entry.get('roi', (ROI_TOP, ROI_BOTTOM)))
+        entry.setdefault('name', f"source-{i}")
+        sources.append(Source(calibration=calibration, **entry))
+    if not sources:
+        raise ValueError(f"No sources listed in '{path}'.")
+    return sources
+
+
+#Minimal HTTP/1.1 client on asyncio streams, enough for phone camera apps:
+#GET with keep-alive, Content-Length, chunked or read-to-close bodies, basic auth from the URL
+class _HTTPConnection:
+    def __init__(self, url, timeout):
+        self.parts = urlsplit(url)
+        self.timeout = timeout
+        self.target = (self.parts.path or '/') + (f"?{self.parts.query}" if self.parts.query else '')
+        self.reader = None
+        self.writer = None
+
+    async def open(self):
+        secure = self.parts.scheme == 'https'
+        port = self.parts.port or (443 if secure else 80)
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.parts.hostname, port, ssl=secure or None), self.timeout)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    #Sends the request and reads the response head, returns the lower-cased headers
+    async def request(self):
+        if self.writer is None:
+            await self.open()
+        head = f"GET {self.target} HTTP/1.1\r\nHost: {self.parts.netloc.rpartition('@')[2]}\r\n"
+        if self.parts.username:
+            token = base64.b64encode(f"{self.parts.username}:{self.parts.password or ''}".encode()).decode()
+            head += f"Authorization: Basic {token}\r\n"
+        self.writer.write((head + "Connection: keep-alive\r\n\r\n").encode())
+        await self.writer.drain()
+
+        response = await asyncio.wait_for(self.reader.readuntil(b'\r\n\r\n'), self.timeout)
+        lines = response.decode('latin-1').split('\r\n')
+        status = int(lines[0].split()[1])
+        headers = {}
+        for line in lines[1:]:
+            key, _, value = line.partition(':')
+            if value:
+                headers[key.strip().lower()] = value.strip()
+        if status != 200:
+            self.close()
+            raise OSError(f"HTTP {status} from {self.parts.geturl()}")
+        return headers
+
+    #Data of a Transfer-Encoding: chunked body, one chunk at a time, until the last chunk
+    async def _chunks(self):
+        reader = self.reader
+        while True:
+            line = await asyncio.wait_for(reader.readline(), self.timeout)
+            if not line:
+                raise ConnectionError("stream closed")
+            size = int(line.split(b';')[0], 16)
+            chunk = await asyncio.wait_for(reader.readexactly(size + 2), self.timeout)
+            if size == 0:
+                return
+            yield chunk[:-2]
+
+    #Whole response body; the connection is kept for the next request when the server allows it
+    async def body(self, headers):
+        reader = self.reader
+        if 'content-length' in headers:
+            data = await asyncio.wait_for(reader.readexactly(int(headers['content-length'])), self.timeout)
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            data = b''.join([chunk async for chunk in self._chunks()])
+        else:
+            data = await asyncio.wait_for(reader.read(), self.timeout)
+            self.close()
+            return data
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return data
+
+    #Body of an open-ended response (an MJPEG stream) as it arrives, de-chunked when the server
+    #sends it chunked, until the server ends it
+    async def stream(self, headers, chunk_size):
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            async for chunk in self._chunks():
+                yield chunk
+            return
+        while True:
+            chunk = await asyncio.wait_for(self.reader.read(chunk_size), self.timeout)
+            if not chunk:
+                return
+            yield chunk
+
+
+#Fetch/analysis state of one source: only the newest fetched frame is kept, and at most one
+#analysis per source runs at a time, so the per-source decoder and processor need no locks
+#scorer: an ElementScorer, or a function of the source's tolerance returning one
+class SourceWorker:
+    def __init__(self, source, scorer=None):
+        self.source = source
+        if callable(scorer):
+            scorer = scorer(source.tolerance)
+        self.decoder = FrameDecoder(*source.roi)
+        self.processor = StreamingProcessor(source.tolerance, source.calibration,
+                                            stabilization_factor=source.stabilization_factor, scorer=scorer)
+        self.latest = None
+        self.fetched = 0
+        self.dropped = 0
+        self.errors = 0
+        self.analysed = 0
+        self._ready = asyncio.Event()
+        self._taken = asyncio.Event()
+        self._taken.set()
+
+    def put(self, frame):
+        if self.latest is not None:
+            self.dropped += 1
+        self.latest = frame
+        self.fetched += 1
+        self._taken.clear()
+        self._ready.set()
+
+    async def take(self):
+        await self._ready.wait()
+        self._ready.clear()
+        frame, self.latest = self.latest, None
+        self._taken.set()
+        return frame
+
+    #Waits until the newest frame went to analysis (single-shot polling fetches the
+    #next frame while the previous one is analysed, not faster)
+    async def wait_taken(self):
+        await self._taken.wait()
+
+    #Runs on the worker pool
+    def analyse(self, frame):
+        return self.processor.process(self.decoder.intensity(frame.data))
+
+
+#Runs every source concurrently until stop() (or cancellation)
+#on_result(source, frame, result) is called on the event loop thread for every analysed frame
+class MultiSourceAnalyser:
+    def __init__(self, sources, on_result, workers=None, timeout=5.0, retry_delay=0.5, chunk_size=64 * 1024,
+                 scorer=None, log=sys.stderr):
+        self.workers = [SourceWorker(source, scorer) for source in sources]
+        self.on_result = on_result
+        self.pool = ThreadPoolExecutor(workers or min(len(sources), os.cpu_count() or 1), 'lumas-analysis')
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        self.chunk_size = chunk_size
+        self.log = log
+        self._stopping = None
+
+    async def run(self, extra_tasks=()):
+        self._stopping = asyncio.Event()
+        tasks = [asyncio.create_task(coroutine) for worker in self.workers
+                 for coroutine in (self._fetch(worker), self._analyse(worker))]
+        tasks += [asyncio.create_task(coroutine) for coroutine in extra_tasks]
+        try:
+            await self._stopping.wait()
+        finally:
+            #Cancelled again until done: before Python 3.12 wait_for can swallow a cancellation
+            #that arrives just as its read completes
+            pending = set(tasks)
+            while pending:
+                for task in pending:
+                    task.cancel()
+                _, pending = await asyncio.wait(pending, timeout=0.1)
+            self.pool.shutdown(wait=True)
+
+    def stop(self):
+        if self._stopping is not None:
+            self._stopping.set()
+
+    async def _fetch(self, worker):
+        source = worker.source
+        while True:
+            connection = _HTTPConnection(source.url, self.timeout)
+            try:
+                if source.mode == 'mjpeg':
+                    headers = await connection.request()
+                    parser = MJPEGParser()
+                    async for chunk in connection.stream(headers, self.chunk_size):
+                        for data in parser.feed(chunk):
+                            worker.put(Frame(time.time(), data))
+                        #Reads of already buffered data do not suspend, let the other sources run
+                        await asyncio.sleep(0)
+                    raise ConnectionError("stream closed")
+                else:
+                    while True:
+                        data = await connection.body(await connection.request())
+                        worker.put(Frame(time.time(), data))
+                        await worker.wait_taken()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                worker.errors += 1
+                print(f"Error: {source.name}: {e or type(e).__name__}", file=self.log)
+                await asyncio.sleep(self.retry_delay)
+            finally:
+                connection.close()
+
+    async def _analyse(self, worker):
+        loop = asyncio.get_running_loop()
+        while True:
+            frame = await worker.take()
+            try:
+                result = await loop.run_in_executor(self.pool, worker.analyse, frame)
+            except Exception as e:
+                worker.errors += 1
+                print(f"Error: {worker.source.name}: {e}", file=self.log)
+                continue
+            worker.analysed += 1
+            self.on_result(worker.source, frame, result)
+
+    #One line per source: analysed FPS since the previous call, dropped frames and errors
+    async def report_stats(self, interval):
+        last = {id(worker): 0 for worker in self.workers}
+        while True:
+            await asyncio.sleep(interval)
+            for worker in self.workers:
+                fps = (worker.analysed - last[id(worker)]) / interval
+                last[id(worker)] = worker.analysed
+                print(f"{worker.source.name}: FPS {fps:.1f} | fetched {worker.fetched} | dropped {worker.dropped} "
+                      f"| errors {worker.errors}", file=self.log)
+
+
+#Tiled live plots, one LiveRenderer per source on a shared figure, redrawn from the event loop
+class Dashboard:
+    def __init__(self, sources, max_fps=15):
+        import matplotlib.pyplot as plt
+        from .plotting import LiveRenderer
+
+        self.plt = plt
+        columns = math.ceil(math.sqrt(len(sources)))
+        rows = math.ceil(len(sources) / columns)
+        plt.ion()
+        self.fig, axes = plt.subplots(rows, columns, squeeze=False, figsize=(5 * columns, 3.5 * rows))
+        axes = axes.ravel()
+        for ax in axes[len(sources):]:
+            ax.set_visible(False)
+        self.renderers = {}
+        for source, ax in zip(sources, axes):
+            renderer = LiveRenderer(self.fig, ax, max_fps=max_fps, calibration=source.calibration)
+            ax.set_title(source.name)
+            self.renderers[source.name] = renderer
+        self.interval = 1.0 / max_fps if max_fps else 0.05
+        self.fig.tight_layout()
+        plt.show(block=False)
+
+    def update(self, source, frame, result):
+        self.renderers[source.name].update(result)
+
+    async def run(self):
+        while True:
+            drawn = False
+            for renderer in self.renderers.values():
+                drawn = renderer.draw() or drawn
+            if not drawn:
+                self.fig.canvas.flush_events()
+            await asyncio.sleep(self.interval)
+
+
+#Merged newline-delimited JSON results (each record tagged with its source), or a tiled dashboard
+def run_sources(sources, output='-', dashboard=False, workers=None, timeout=5.0, stats_interval=5.0, max_fps=15,
+                log=sys.stderr):
+    if not sources:
+        raise ValueError("No sources listed, nothing to analyse.")
+    if dashboard:
+        view = Dashboard(sources, max_fps)
+        on_result = view.update
+        extra = [view.run()]
+        results = None
+    else:
+        results = open_results(output)
+
+        def on_result(source, frame, result):
+            record = spectrum_record(result, frame.timestamp)
+            record['source'] = source.name
+            results.write(record)
+        extra = []
+
+    analyser = MultiSourceAnalyser(sources, on_result, workers, timeout, scorer=default_scorer, log=log)
+    if stats_interval:
+        extra.append(analyser.report_stats(stats_interval))
+    print(f"Analysing {len(sources)} sources...", file=log)
+    try:
+        asyncio.run(analyser.run(extra))
+    except KeyboardInterrupt:
+        print("Stopping live analysis...", file=log)
+    finally:
+        if results is not None:
+            results.close()
+    return analyser
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse several live camera streams in one process.")
+    parser.add_argument('sources', help="JSON file listing the sources (name, url, mode, roi, calibration, tolerance)")
+    parser.add_argument('--output', default='-', help="'-', a file, tcp://host:port or unix://path")
+    parser.add_argument('--dashboard', action='store_true', help="tiled live plots instead of JSON records")
+    parser.add_argument('--workers', type=int, default=None, help="analysis threads, default one per source/CPU")
+    parser.add_argument('--timeout', type=float, default=5.0)
+    parser.add_argument('--stats-interval', type=float, default=5.0, help="0 turns the stats lines off")
+    args = parser.parse_args(argv)
+    try:
+        sources = load_sources(args.sources)
+    except ValueError as e:
+        parser.error(str(e))
+    run_sources(sources, args.output, args.dashboard, args.workers, args.timeout, args.stats_interval)
+
+
+if __name__ == '__main__':
+    main()
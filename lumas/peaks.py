@@ -0,0 +1,87 @@
+#PEAK REFINEMENT AND METRICS
+#Sub-pixel peak centres and per-peak width, prominence and signal-to-noise ratio,
+#computed for all peaks of a spectrum at once
+
+#Libraries
+from dataclasses import dataclass
+
+import numpy as np
+from scipy.signal import peak_prominences, peak_widths
+
+from .baseline import MAD_TO_STD
+
+REFINE_METHODS = ('gaussian', 'parabolic')
+
+#Pixels around a peak searched for the minima its prominence and width are measured from,
+#so a line on a broad continuum hump does not take in the hump
+PROMINENCE_WINDOW = 101
+
+
+#Per-peak measurements, one entry per detected peak
+@dataclass
+class PeakMetrics:
+    positions: np.ndarray  #Sub-pixel peak centres
+    wavelengths: np.ndarray  #Centres in nm
+    fwhm: np.ndarray  #Full width at half prominence in nm
+    prominences: np.ndarray  #Height above the higher of the two surrounding minima
+    snr: np.ndarray  #Prominence over the noise level at the peak
+    noise: np.ndarray  #Noise level (standard deviation) at every peak the SNR is relative to
+
+
+#Sub-pixel centres from the peak sample and its two neighbours
+#parabolic: vertex of the parabola through the three samples
+#gaussian: the same on log values (exact for Gaussian line shapes), parabolic where a sample is not positive
+def refine_positions(intensity, peaks, method='gaussian'):
+    if method not in REFINE_METHODS:
+        raise ValueError(f"Unknown refinement '{method}', use one of {', '.join(REFINE_METHODS)}.")
+    intensity = np.asarray(intensity, dtype=float)
+    peaks = np.asarray(peaks, dtype=np.intp)
+    positions = peaks.astype(float)
+    inner = (peaks > 0) & (peaks < len(intensity) - 1)
+    centre = peaks[inner]
+    left, middle, right = intensity[centre - 1], intensity[centre], intensity[centre + 1]
+
+    if method == 'gaussian':
+        positive = (left > 0) & (middle > 0) & (right > 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            logs = np.log(np.where(positive, [left, middle, right], 1.0))
+        left = np.where(positive, logs[0], left)
+        middle = np.where(positive, logs[1], middle)
+        right = np.where(positive, logs[2], right)
+
+    curvature = left - 2 * middle + right
+    with np.errstate(divide='ignore', invalid='ignore'):
+        offset = np.where(curvature < 0, 0.5 * (left - right) / curvature, 0.0)
+    positions[inner] += np.clip(offset, -0.5, 0.5)
+    return positions
+
+
+#Noise level of a spectrum from the residual of its smoothing (robust to peaks and slopes)
+def noise_level(intensity, smoothed_intensity):
+    residual = np.asarray(intensity, dtype=float) - smoothed_intensity
+    return MAD_TO_STD * np.median(np.abs(residual - np.median(residual)))
+
+
+#All metrics for the peaks of one spectrum
+#intensity: raw (or stabilized) intensity, only used for the noise level
+#noise: per-pixel noise level the peaks were detected against (baseline.local_noise), so the SNR
+#matches the threshold; None uses the whole spectrum's noise_level
+def measure_peaks(intensity, smoothed_intensity, peaks, calibration, method='gaussian', noise=None):
+    peaks = np.asarray(peaks, dtype=np.intp)
+    positions = refine_positions(smoothed_intensity, peaks, method)
+    wavelengths = calibration.pixel_to_wavelength(positions)
+    if len(peaks):
+        prominences, left_bases, right_bases = peak_prominences(smoothed_intensity, peaks, PROMINENCE_WINDOW)
+        _, _, left_ips, right_ips = peak_widths(smoothed_intensity, peaks, 0.5,
+                                                (prominences, left_bases, right_bases))
+        fwhm = np.abs(calibration.pixel_to_wavelength(right_ips) - calibration.pixel_to_wavelength(left_ips))
+    else:
+        prominences = np.empty(0)
+        fwhm = np.empty(0)
+    if noise is None:
+        peak_noise = np.full(len(peaks), noise_level(intensity, smoothed_intensity))
+    else:
+        peak_noise = np.asarray(noise, dtype=float)[peaks]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        snr = np.where(peak_noise > 0, prominences / peak_noise, np.inf)
+    return PeakMetrics(positions, wavelengths, fwhm, prominences, snr, peak_noise)
@@ -0,0 +1,160 @@
+#SPECTRUM ANALYSIS PIPELINE
+#Pure functions only: no plotting, no sleeping, no file moves
+
+#Libraries
+from dataclasses import dataclass
+
+import numpy as np
+from PIL import Image
+from scipy.signal import find_peaks, savgol_filter
+
+from .band import band_intensity, find_spectrum_band
+from .baseline import adaptive_threshold
+from .calibration import default_calibration
+from .decode import decode_intensity
+from .lines import default_line_index
+from .peaks import PeakMetrics, measure_peaks
+from .timing import timed
+
+#Where the spectrum is read from (adjust based on where the spectrum is most visible):
+#a row number, a (top, bottom) band of rows, or 'auto' to find the brightest band
+SPECTRUM_ROW = 100
+
+#Savitzky-Golay smoothing settings
+SMOOTHING_WINDOW = 11
+SMOOTHING_ORDER = 2
+
+#Peak threshold: 'adaptive' removes the continuum (BASELINE_METHOD, see lumas/baseline.py),
+#peaks must rise THRESHOLD_NOISE_FACTOR local noise levels above it and stand out
+#PROMINENCE_NOISE_FACTOR noise levels from their surroundings (no ripples on a bright
+#continuum); 'global' is one level for the whole spectrum, mean + THRESHOLD_STD_FACTOR * std
+THRESHOLD_METHOD = 'adaptive'
+THRESHOLD_NOISE_FACTOR = 3.0
+PROMINENCE_NOISE_FACTOR = 2.0
+BASELINE_METHOD = 'als'
+THRESHOLD_STD_FACTOR = 0.5
+
+#Sub-pixel peak centres: 'gaussian', 'parabolic' or None for whole pixels
+PEAK_REFINEMENT = 'gaussian'
+
+
+#Everything the pipeline found in one spectrum
+@dataclass
+class SpectrumResult:
+    intensity: np.ndarray
+    smoothed_intensity: np.ndarray
+    wavelengths: np.ndarray
+    threshold: np.ndarray  #Per-pixel threshold ('adaptive'), or one float ('global')
+    peaks: np.ndarray
+    peak_wavelengths: np.ndarray
+    elements: list  #One list of (element, wavelength) matches per peak
+    peak_ids: np.ndarray = None  #Stable ids of tracked peaks (live streaming only)
+    candidates: list = None  #Ranked scoring.Candidate list, when a scorer was used
+    peak_metrics: PeakMetrics = None  #Sub-pixel centres, FWHM, prominence and SNR of every peak
+    baseline: np.ndarray = None  #Estimated continuum under the lines ('adaptive' threshold only)
+
+    @property
+    def peak_intensities(self):
+        return self.smoothed_intensity[self.peaks]
+
+    #Peak wavelength -> matches, only for peaks that matched something
+    def detected_elements(self):
+        return {peak_wl: elements for peak_wl, elements in zip(self.peak_wavelengths, self.elements) if elements}
+
+
+#Load an image file as an RGB array
+def load_image_array(path):
+    with Image.open(path) as image:
+        return np.array(image.convert('RGB'))
+
+
+#Conversion of the spectrum row (or band, or 'auto') into intensity (mean of the RGB channels)
+def row_intensity(image_array, row=SPECTRUM_ROW):
+    if isinstance(row, str):
+        if row != 'auto':
+            raise ValueError(f"Unknown spectrum row '{row}', use a row number, (top, bottom) or 'auto'.")
+        return band_intensity(image_array, find_spectrum_band(image_array))
+    if isinstance(row, (tuple, list)):
+        return band_intensity(image_array, row)
+    return np.mean(image_array[row, :, :], axis=1)
+
+
+#Command line form of a spectrum row: '100', '80:140' or 'auto'
+def parse_row(text):
+    if text == 'auto':
+        return text
+    if ':' in text:
+        top, bottom = text.split(':')
+        return int(top), int(bottom)
+    return int(text)
+
+
+#Smoothening intensity values for noise reduction using the Sav_Gol filter
+def smooth_intensity(intensity):
+    return savgol_filter(intensity, window_length=SMOOTHING_WINDOW, polyorder=SMOOTHING_ORDER)
+
+
+#Threshold peak detection, returns (threshold, peak indices, baseline, local noise), the last two
+#None for 'global'
+#intensity: the unsmoothed spectrum, the 'adaptive' threshold takes the local noise from it
+def detect_peaks(smoothed_intensity, intensity=None, method=THRESHOLD_METHOD):
+    if method == 'global':
+        threshold = np.mean(smoothed_intensity) + np.std(smoothed_intensity) * THRESHOLD_STD_FACTOR
+        peaks, _ = find_peaks(smoothed_intensity, height=threshold)
+        return threshold, peaks, None, None
+    if method != 'adaptive':
+        raise ValueError(f"Unknown threshold method '{method}', use 'adaptive' or 'global'.")
+    if intensity is None:
+        raise ValueError("The adaptive threshold needs the unsmoothed intensity.")
+    threshold, baseline, noise = adaptive_threshold(intensity, smoothed_intensity, THRESHOLD_NOISE_FACTOR,
+                                                    BASELINE_METHOD)
+    peaks, _ = find_peaks(smoothed_intensity, height=threshold, prominence=PROMINENCE_NOISE_FACTOR * noise)
+    return threshold, peaks, baseline, noise
+
+
+#Smoothing, calibration, peak detection and element matching for an intensity vector
+#Each stage is recorded in timer (a StageTimer) when one is given, elements are ranked
+#into result.candidates when a scorer (scoring.ElementScorer) is given
+#refine: sub-pixel method for the peak wavelengths (see PEAK_REFINEMENT), None keeps whole pixels
+#threshold_method: 'adaptive' or 'global' (see THRESHOLD_METHOD)
+def analyse_intensity(intensity, tolerance=10, calibration=None, line_index=None, timer=None, scorer=None,
+                      refine=PEAK_REFINEMENT, threshold_method=THRESHOLD_METHOD):
+    if calibration is None:
+        calibration = default_calibration
+    if line_index is None:
+        line_index = default_line_index()
+    with timed(timer, 'smoothing'):
+        smoothed_intensity = smooth_intensity(intensity)
+    with timed(timer, 'calibration'):
+        wavelengths = calibration.axis(len(smoothed_intensity))
+    with timed(timer, 'peaks'):
+        threshold, peaks, baseline, noise = detect_peaks(smoothed_intensity, intensity, threshold_method)
+        peak_metrics = measure_peaks(intensity, smoothed_intensity, peaks, calibration, refine or 'parabolic', noise)
+        peak_wavelengths = peak_metrics.wavelengths if refine else wavelengths[peaks]
+    with timed(timer, 'matching'):
+        elements = line_index.query(peak_wavelengths, tolerance)
+    result = SpectrumResult(intensity, smoothed_intensity, wavelengths, threshold, peaks, peak_wavelengths, elements,
+                            peak_metrics=peak_metrics, baseline=baseline)
+    if scorer is not None:
+        with timed(timer, 'scoring'):
+            result.candidates = scorer.score_result(result)
+    return result
+
+
+#Full pipeline for an RGB image array
+def analyse(image_array, tolerance=10, row=SPECTRUM_ROW, calibration=None, line_index=None, timer=None,
+            scorer=None):
+    with timed(timer, 'intensity'):
+        intensity = row_intensity(image_array, row)
+    return analyse_intensity(intensity, tolerance, calibration, line_index, timer, scorer)
+
+
+#Full pipeline for an image file, using the low-memory decode path
+#correction: optional accumulate.DetectorCorrection (dark frame / flat field) applied before analysis
+def analyse_image(path, tolerance=10, row=SPECTRUM_ROW, calibration=None, line_index=None, timer=None,
+                  scorer=None, correction=None):
+    with timed(timer, 'decode'):
+        intensity = decode_intensity(path, row)
+    if correction is not None:
+        intensity = correction.apply(intensity).copy()
+    return analyse_intensity(intensity, tolerance, calibration, line_index, timer, scorer)
@@ -0,0 +1,242 @@
+#PLOTTING HELPERS
+#Matplotlib is imported inside each function so headless users of lumas never load it
+
+#Libraries
+import time
+
+import numpy as np
+
+from .calibration import default_calibration
+from .colors import spectrum_colors
+
+
+#Draw the spectrum as a single LineCollection, segment i goes from pixel i to
+#pixel i + 1 and takes the color of pixel i (same as the old per-pair ax.plot loop)
+def plot_colored_spectrum(ax, wavelengths, intensity, colors, linewidth=2):
+    from matplotlib.collections import LineCollection
+
+    points = np.column_stack([wavelengths, intensity])
+    segments = np.stack([points[:-1], points[1:]], axis=1)
+    collection = LineCollection(segments, colors=colors[:-1], linewidths=linewidth, capstyle='projecting')
+    ax.add_collection(collection)
+    ax.autoscale_view()
+    return collection
+
+
+#Interactive color map of a SpectrumResult, click near a peak to toggle its element data
+def show_spectrum(result, ylabel='Smoothed Intensity', title='Spectrum with Element Detection'):
+    import matplotlib.pyplot as plt
+
+    smoothed_intensity = result.smoothed_intensity
+    peaks = result.peaks
+    peak_wavelengths = result.peak_wavelengths
+
+    #Track which peaks have been clicked (for toggling)
+    clicked_peaks = {}
+
+    #Toggle element data on click
+    def on_peak_click(event, ax):
+        if event.inaxes == ax and len(peak_wavelengths):
+            #Find the nearest peak to the clicked point
+            nearest_peak_idx = np.abs(peak_wavelengths - event.xdata).argmin()
+            nearest_peak_wavelength = peak_wavelengths[nearest_peak_idx]
+            xy = (nearest_peak_wavelength, smoothed_intensity[peaks[nearest_peak_idx]])
+
+            if nearest_peak_wavelength in clicked_peaks:
+                #Remove annotation if already clicked
+                clicked_peaks[nearest_peak_wavelength].remove()
+                del clicked_peaks[nearest_peak_wavelength]
+            else:
+                #Show element data if not clicked
+                elements = result.elements[nearest_peak_idx]
+                if elements:
+                    text = '\n'.join([f'{el}: {wl} nm' for el, wl in elements])
+                    color = 'blue'
+                else:
+                    text = 'No matching elements'
+                    color = 'red'
+                clicked_peaks[nearest_peak_wavelength] = ax.annotate(text, xy, textcoords="offset points",
+                                                                     xytext=(0, 10), ha='center', color=color)
+            plt.draw()
+
+    fig, ax = plt.subplots(figsize=(10, 5))
+
+    #One collection artist for the whole spectrum instead of one line per pixel pair
+    plot_colored_spectrum(ax, result.wavelengths, smoothed_intensity, spectrum_colors(result.wavelengths))
+
+    #Mark upward peaks
+    ax.plot(peak_wavelengths, smoothed_intensity[peaks], "x", label="Upward Peaks", color='green')
+
+    #Connect click event to plot
+    fig.canvas.mpl_connect('button_press_event', lambda event: on_peak_click(event, ax))
+
+    ax.set_xlabel('Wavelength (nm)')
+    ax.set_ylabel(ylabel)
+    ax.set_title(title)
+    ax.legend()
+
+    plt.show()
+    return fig
+
+
+#Live plot with persistent artists: the line and fill are updated in place and blitted
+#over a cached background (regions, axes, legend, annotations), and redraws are capped
+#at max_fps so a fast analysis loop never waits on matplotlib for every frame
+#Text is by far the slowest thing to draw, so annotations live in the background and
+#only trigger a full redraw when the annotated peaks change or drift by more than
+#annotation_drift of the y range
+#calibration: the one the results were analysed with (default the built-in one), annotations
+#are placed on the curve through its inverse
+class LiveRenderer:
+    def __init__(self, fig, ax, max_fps=15, annotation_drift=0.05, calibration=None):
+        self.fig = fig
+        self.ax = ax
+        self.calibration = default_calibration if calibration is None else calibration
+        self.canvas = fig.canvas
+        self.min_interval = 1.0 / max_fps if max_fps else 0.0
+        self.use_blit = self.canvas.supports_blit
+        self.annotation_drift = annotation_drift
+
+        self.line, = ax.plot([], [], label="Spectrum", color="blue", animated=self.use_blit)
+        self.fill = ax.fill_between([], [], color="blue", alpha=0.1)  # Highlight area
+        self.fill.set_animated(self.use_blit)
+
+        #Highlight RGB regions
+        ax.axvspan(400, 500, color='blue', alpha=0.2, label="Blue Region")
+        ax.axvspan(500, 600, color='green', alpha=0.2, label="Green Region")
+        ax.axvspan(600, 700, color='red', alpha=0.2, label="Red Region")
+
+        ax.set_xlabel("Wavelength (nm)")
+        ax.set_ylabel("Intensity")
+        ax.set_title("Live Spectrum Analysis")
+        ax.legend()
+
+        #Stats overlay, part of the background so it only costs a redraw when its text changes
+        self.overlay = ax.text(0.01, 0.99, '', transform=ax.transAxes, va='top', ha='left', fontsize=8,
+                               family='monospace', bbox=dict(facecolor='white', alpha=0.7, edgecolor='none'))
+        self.overlay_changed = False
+
+        self.annotations = []
+        self.annotated = []  #(peak wavelength, text) for each visible annotation
+        self.annotated_heights = np.empty(0)
+        self.background = None
+        self.pending = None
+        self.skipped = 0  #Results replaced before they were drawn
+        self.last_draw = float('-inf')
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+
+    #Latest result to show, older undrawn results are simply replaced
+    def update(self, result):
+        if self.pending is not None:
+            self.skipped += 1
+        self.pending = result
+
+    #Text shown in the top-left corner of the plot (e.g. a StageTimer report), drawn with the next frame
+    def set_overlay(self, text):
+        if text != self.overlay.get_text():
+            self.overlay.set_text(text)
+            self.overlay_changed = True
+
+    #Draw the pending result if the display rate allows it, returns True if drawn
+    def draw(self, force=False):
+        now = time.perf_counter()
+        if self.pending is None or (not force and now - self.last_draw < self.min_interval):
+            return False
+        result = self.pending
+        self.pending = None
+        self.last_draw = now
+
+        full_redraw = self._set_data(result) or self.overlay_changed
+        self.overlay_changed = False
+        if full_redraw or self.background is None or not self.use_blit:
+            #Full redraw, the draw_event handler recaptures the background
+            self.canvas.draw()
+            if self.use_blit:
+                self.canvas.blit(self.fig.bbox)
+        else:
+            #Only this axes is restored and blitted, so several renderers can share one figure
+            self.canvas.restore_region(self.background)
+            self._draw_animated()
+            self.canvas.blit(self.ax.bbox)
+        self.canvas.flush_events()
+        return True
+
+    def _on_draw(self, event):
+        if self.use_blit:
+            self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+            self._draw_animated()
+
+    def _draw_animated(self):
+        self.ax.draw_artist(self.fill)
+        self.ax.draw_artist(self.line)
+
+    #Update artists in place, returns True if the background has to be redrawn
+    def _set_data(self, result):
+        wavelengths = result.wavelengths
+        smoothed_intensity = result.smoothed_intensity
+        self.line.set_data(wavelengths, smoothed_intensity)
+        self.fill.set_verts([np.concatenate([[[wavelengths[0], 0]],
+                                             np.column_stack([wavelengths, smoothed_intensity]),
+                                             [[wavelengths[-1], 0]]])])
+
+        limits_changed = self._update_limits(wavelengths, smoothed_intensity)
+        annotations_changed = self._set_annotations(result)
+        return limits_changed or annotations_changed
+
+    #Annotate detected peaks and elements, reusing annotation artists between frames
+    #Returns True if the annotations changed enough to need a background redraw
+    #Annotations sit at the peak wavelengths, sub-pixel when the pipeline refines them, with
+    #the height read off the curve there
+    def _set_annotations(self, result):
+        wavelengths = result.wavelengths
+        smoothed_intensity = result.smoothed_intensity
+        annotated = []
+        for peak_wl, elements in zip(result.peak_wavelengths, result.elements):
+            if elements:
+                annotated.append((float(peak_wl), ', '.join([f"{el} ({wl:.1f} nm)" for el, wl in elements])))
+        anchors = [peak_wl for peak_wl, _ in annotated]
+        width = len(smoothed_intensity)
+        heights = np.interp(self.calibration.wavelength_to_pixel(anchors, width), np.arange(width),
+                            smoothed_intensity)
+
+        #Sub-pixel centres jitter from frame to frame, moves of less than a pixel count as unchanged
+        bottom, top = self.ax.get_ylim()
+        pixel_width = abs(wavelengths[1] - wavelengths[0]) if len(wavelengths) > 1 else 0.0
+        if [text for _, text in annotated] == [text for _, text in self.annotated] and (
+                not len(heights) or (
+                    np.max(np.abs(heights - self.annotated_heights)) <= self.annotation_drift * (top - bottom) and
+                    np.max(np.abs(np.subtract(anchors, [wl for wl, _ in self.annotated]))) < pixel_width)):
+            return False
+
+        for count, ((peak_wl, text), height) in enumerate(zip(annotated, heights)):
+            if count == len(self.annotations):
+                self.annotations.append(self._new_annotation())
+            annotation = self.annotations[count]
+            annotation.set_text(text)
+            annotation.xy = (peak_wl, height)
+            annotation.set_visible(True)
+        for annotation in self.annotations[len(annotated):len(self.annotated)]:
+            annotation.set_visible(False)
+        self.annotated = annotated
+        self.annotated_heights = heights
+        return True
+
+    def _new_annotation(self):
+        return self.ax.annotate("", (0, 0), textcoords="offset points", xytext=(0, 10), ha='center', fontsize=8,
+                                color="black",
+                                bbox=dict(boxstyle="round,pad=0.3", edgecolor="black", facecolor="white", alpha=0.8))
+
+    #Keep some headroom so the limits (and the cached background) rarely change
+    def _update_limits(self, wavelengths, smoothed_intensity):
+        xlim = (float(np.min(wavelengths)), float(np.max(wavelengths)))
+        low = min(0.0, float(np.min(smoothed_intensity)) * 1.05)
+        high = float(np.max(smoothed_intensity))
+        bottom, top = self.ax.get_ylim()
+        changed = False
+        if self.ax.get_xlim() != xlim:
+            self.ax.set_xlim(xlim)
+            changed = True
+        if high > top or high < 0.6 * top or low < bottom:
+            self.ax.set_ylim(low, max(high * 1.15, 1.0))
+            changed = True
+        return changed
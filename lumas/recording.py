@@ -0,0 +1,169 @@
+#FRAME RECORDING AND REPLAY
+#Raw camera frames are recorded with their arrival times to one file, and a replay source
+#feeds them back through the live analysis exactly like a camera would: at the recorded
+#rate, or as fast as the analysis takes them for a repeatable throughput measurement
+#
+#File layout: MAGIC, then per frame a little-endian (float64 timestamp, uint32 size) header
+#followed by the encoded image bytes as the camera sent them
+
+#Libraries
+import argparse
+import struct
+import threading
+import time
+
+from .stream import Frame, FrameFetcher, MJPEGStream
+
+MAGIC = b'LUMASREC1\n'
+_FRAME_HEADER = struct.Struct('<dI')
+
+
+#Appends frames to a recording file, safe to call from the fetch thread
+class FrameRecorder:
+    def __init__(self, path):
+        self.path = path
+        self.frames = 0
+        self._lock = threading.Lock()
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+
+    def write(self, frame):
+        with self._lock:
+            self._file.write(_FRAME_HEADER.pack(frame.timestamp, len(frame.data)))
+            self._file.write(frame.data)
+            self.frames += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+#All frames of a recording in order, read lazily
+def read_recording(path):
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"'{path}' is not a LUMAS frame recording.")
+        while True:
+            header = f.read(_FRAME_HEADER.size)
+            if len(header) < _FRAME_HEADER.size:
+                return
+            timestamp, size = _FRAME_HEADER.unpack(header)
+            data = f.read(size)
+            if len(data) < size:
+                #Recording cut off mid-frame (e.g. the recorder was killed)
+                return
+            yield Frame(timestamp, data)
+
+
+#Frame source playing a recording, with the same interface as FrameFetcher
+#speed: 1.0 plays at the recorded rate (frames the analysis is too slow for are dropped,
+#as with a camera), 2.0 twice as fast; None hands every frame to get() as soon as it is
+#asked for, nothing is dropped and the run is the same every time
+#Frames keep their recorded timestamps; finished turns True once the recording is used up
+class ReplaySource(FrameFetcher):
+    def __init__(self, path, speed=1.0, loop=False, max_frames=1, timer=None):
+        super().__init__(path, max_frames=max_frames, timer=timer)
+        self.speed = speed
+        self.loop = loop
+        self._frames = None
+        self._done = threading.Event()
+
+    #Frames come from the file, no HTTP session
+    def _open_session(self):
+        return None
+
+    def _recording(self):
+        while True:
+            count = 0
+            for frame in read_recording(self.url):
+                count += 1
+                yield frame
+            if not self.loop or not count:
+                return
+
+    def start(self):
+        self._frames = self._recording()
+        if self.speed is not None:
+            return super().start()
+        return self
+
+    @property
+    def finished(self):
+        return self._done.is_set() and self.frames.empty()
+
+    def get(self, timeout=None):
+        if self.speed is not None:
+            if self.finished:
+                return None
+            return super().get(timeout)
+        start = time.perf_counter()
+        frame = next(self._frames, None)
+        if frame is None:
+            self._done.set()
+            return None
+        if self.timer is not None:
+            self.timer.add('fetch', time.perf_counter() - start)
+        self.fetched += 1
+        return frame
+
+    #Recorded gaps between frames are reproduced (divided by speed) against the wall clock
+    def _run(self):
+        previous = None
+        for frame in self._frames:
+            #First frame, or the recording started over: times count from here
+            if previous is None or frame.timestamp < previous:
+                first = frame.timestamp
+                start = time.perf_counter()
+            previous = frame.timestamp
+            delay = start + (frame.timestamp - first) / self.speed - time.perf_counter()
+            if delay > 0 and self._stop.wait(delay):
+                break
+            if self._stop.is_set():
+                break
+            self.fetched += 1
+            self._put(frame)
+        self._done.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record live camera frames for replay, or describe a recording.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    record = subparsers.add_parser('record', help="record frames from a camera URL")
+    record.add_argument('url', help="MJPEG stream (e.g. http://device-ip:8080/video) or single-shot JPEG URL")
+    record.add_argument('output')
+    record.add_argument('--mode', default='mjpeg', choices=('mjpeg', 'shot'))
+    record.add_argument('--seconds', type=float, default=30)
+    info = subparsers.add_parser('info', help="frame count, duration and rate of a recording")
+    info.add_argument('recording')
+    args = parser.parse_args(argv)
+
+    if args.command == 'record':
+        source = MJPEGStream if args.mode == 'mjpeg' else FrameFetcher
+        with FrameRecorder(args.output) as recorder:
+            with source(args.url, recorder=recorder):
+                try:
+                    time.sleep(args.seconds)
+                except KeyboardInterrupt:
+                    pass
+        print(f"Recorded {recorder.frames} frames to '{args.output}'.")
+    else:
+        count = size = 0
+        first = last = None
+        for frame in read_recording(args.recording):
+            count += 1
+            size += len(frame.data)
+            first = frame.timestamp if first is None else first
+            last = frame.timestamp
+        duration = last - first if count > 1 else 0.0
+        rate = (count - 1) / duration if duration > 0 else 0.0
+        print(f"{count} frames, {duration:.1f} s, {rate:.1f} FPS, {size / max(count, 1) / 1024:.1f} KiB per frame")
+
+
+if __name__ == '__main__':
+    main()
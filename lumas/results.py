@@ -0,0 +1,83 @@
+#STRUCTURED RESULTS STREAM
+#Newline-delimited JSON, one compact record per analysed frame
+
+#Libraries
+import json
+import math
+import socket
+import sys
+
+
+#Values rounded for the record, non-finite ones (an SNR over zero noise) as None, JSON null
+def _rounded(values, digits):
+    return [round(value, digits) if math.isfinite(value) else None for value in values]
+
+
+#Compact, JSON-ready record of one SpectrumResult
+#Tracked peaks (StreamingProcessor) also carry their stable peak ids
+def spectrum_record(result, timestamp):
+    record = {
+        'timestamp': timestamp,
+        'peak_wavelengths': _rounded(result.peak_wavelengths.tolist(), 3),
+        'peak_intensities': _rounded(result.peak_intensities.tolist(), 3),
+        'elements': [[[el, wl] for el, wl in elements] for elements in result.elements],
+    }
+    if result.peak_ids is not None:
+        record['peak_ids'] = result.peak_ids.tolist()
+    if result.peak_metrics is not None:
+        metrics = result.peak_metrics
+        record['peak_fwhm'] = _rounded(metrics.fwhm.tolist(), 3)
+        record['peak_prominences'] = _rounded(metrics.prominences.tolist(), 3)
+        record['peak_snr'] = _rounded(metrics.snr.tolist(), 2)
+    if result.candidates is not None:
+        record['candidates'] = [{'element': c.element, 'score': round(c.score, 3), 'probability': round(c.probability, 3),
+                                 'matched': c.matched, 'expected': c.expected} for c in result.candidates]
+    return record
+
+
+#Writes one JSON record per line and flushes it, so consumers see every frame immediately
+#NaN and infinity are refused (ValueError), they are not valid JSON
+class RecordWriter:
+    def __init__(self, stream, close=None):
+        self.stream = stream
+        self._close = close
+
+    def write(self, record):
+        self.stream.write(json.dumps(record, separators=(',', ':'), allow_nan=False) + '\n')
+        self.stream.flush()
+
+    def close(self):
+        if self._close is not None:
+            self._close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+#Open a record writer for target:
+#  '-'                   stdout
+#  'tcp://host:port'     connect to a local TCP listener
+#  'unix:///path/sock'   connect to a Unix domain socket
+#  anything else         file path, records are appended
+def open_results(target='-'):
+    if target in (None, '-'):
+        return RecordWriter(sys.stdout)
+    if target.startswith('tcp://'):
+        host, _, port = target[len('tcp://'):].rpartition(':')
+        sock = socket.create_connection((host, int(port)))
+    elif target.startswith('unix://'):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(target[len('unix://'):])
+    else:
+        f = open(target, 'a')
+        return RecordWriter(f, f.close)
+
+    stream = sock.makefile('w')
+
+    def close():
+        stream.close()
+        sock.close()
+    return RecordWriter(stream, close)
@@ -0,0 +1,161 @@
+#ELEMENT SCORING
+#Ranks elements by how well all of their lines explain the detected peaks, instead of
+#listing every element that has any single line within tolerance of a peak
+
+#Libraries
+from collections import namedtuple
+
+import numpy as np
+
+#One ranked element: score (log-likelihood ratio of the element being present, summed over its
+#lines), probability among the returned candidates, matched/expected line counts and the
+#(line, peak) wavelength pairs that matched
+Candidate = namedtuple('Candidate', ['element', 'score', 'probability', 'matched', 'expected', 'lines'])
+
+
+#Peaks are matched to lines one-to-one within each element: a peak only counts for the element's
+#line closest to it, and each line takes its best peak among those. Each line then gets a match
+#probability p from its peak:
+#    exp(-0.5 * (distance / sigma)**2) * (intensity_floor + (1 - intensity_floor) * peak / strongest peak)
+#cut to 0 beyond tolerance. Every expected line (inside the observed wavelength range) then adds
+#the log-likelihood ratio of what was seen there, element present against absent:
+#    found:    log(detection * p / chance)
+#    missing:  log((1 - detection) / (1 - chance))
+#detection: chance the line shows as a peak when the element is present, detection_rate scaled
+#down for relatively weak lines; chance: chance that one of the spectrum's peaks lands on the line
+#anyway. A poor match counts no worse than a missing line. The evidence adds up, so several
+#corroborating lines outrank a single coincidence, and missing strong lines count against.
+#All elements x lines are held in one padded matrix, a query is a single
+#elements x lines x peaks broadcast
+class ElementScorer:
+    def __init__(self, element_data, sigma=2.0, tolerance=10, detection_rate=0.9, intensity_floor=0.25,
+                 line_weights=None):
+        self.sigma = sigma
+        self.tolerance = tolerance
+        self.detection_rate = detection_rate
+        self.intensity_floor = intensity_floor
+
+        self.element_names = list(element_data)
+        max_lines = max((len(lines) for lines in element_data.values()), default=0)
+        self.lines = np.full((len(self.element_names), max_lines), np.nan)
+        #Relative line weights, 0 for padding; equal weights unless line_weights gives
+        #element -> list of relative intensities in the same order as its lines
+        self.weights = np.zeros_like(self.lines)
+        for i, (element, lines) in enumerate(element_data.items()):
+            self.lines[i, :len(lines)] = lines
+            if line_weights is not None and element in line_weights:
+                self.weights[i, :len(lines)] = line_weights[element]
+            else:
+                self.weights[i, :len(lines)] = 1.0
+        self.valid = ~np.isnan(self.lines)
+        #Detection probability of every line, the element's strongest lines at detection_rate
+        strongest = self.weights.max(axis=1, keepdims=True)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            relative = np.where(strongest > 0, self.weights / strongest, 0.0)
+        self.detection = detection_rate * (intensity_floor + (1 - intensity_floor) * relative)
+
+    #Match probability of every line and the peak it matched (-1 for none), both elements x lines
+    def line_probabilities(self, peak_wavelengths, peak_intensities=None):
+        peaks = np.asarray(peak_wavelengths, dtype=float)
+        if len(peaks) == 0:
+            return np.zeros(self.lines.shape), np.full(self.lines.shape, -1, dtype=np.intp)
+        if peak_intensities is None:
+            strength = np.ones(len(peaks))
+        else:
+            intensities = np.asarray(peak_intensities, dtype=float)
+            strength = intensities / intensities.max() if intensities.max() > 0 else np.ones(len(peaks))
+        strength = self.intensity_floor + (1 - self.intensity_floor) * np.clip(strength, 0, 1)
+
+        distance = self.lines[:, :, None] - peaks  #elements x lines x peaks, NaN for padding
+        with np.errstate(invalid='ignore'):
+            near = np.abs(distance) <= self.tolerance
+        #Within each element, a peak only counts for the line closest to it
+        closest = np.argmin(np.where(self.valid[:, :, None], np.abs(distance), np.inf), axis=1)
+        owned = np.arange(self.lines.shape[1])[None, :, None] == closest[:, None, :]
+        probability = np.where(near & owned, np.exp(-0.5 * (distance / self.sigma) ** 2) * strength, 0.0)
+
+        best_peak = probability.argmax(axis=2)
+        best = np.take_along_axis(probability, best_peak[:, :, None], axis=2)[:, :, 0]
+        return best, np.where(best > 0, best_peak, -1)
+
+    #Ranked candidates for one spectrum, best first
+    #wavelength_range: (first, last) wavelength the camera sees, lines outside it are not expected;
+    #None expects every line in the table
+    #min_score: least evidence for a candidate, 0 = no better explained than by chance
+    #temperature: 1 makes the probabilities posteriors under equal priors, larger flattens them
+    def score(self, peak_wavelengths, peak_intensities=None, wavelength_range=None, min_score=0.0,
+              temperature=1.0, limit=None):
+        peaks = np.asarray(peak_wavelengths, dtype=float)
+        best, best_peak = self.line_probabilities(peaks, peak_intensities)
+
+        expected = self.valid.copy()
+        if wavelength_range is not None:
+            low, high = sorted(wavelength_range)
+            with np.errstate(invalid='ignore'):
+                expected &= (self.lines >= low) & (self.lines <= high)
+        else:
+            low, high = np.nanmin(self.lines), np.nanmax(self.lines)
+
+        #Chance that a line has a peak within the Gaussian's effective width by coincidence
+        window = self.sigma * np.sqrt(2 * np.pi)
+        chance = np.clip(1 - np.exp(-len(peaks) * window / max(high - low, window)), 1e-6, 0.99)
+        detection = self.detection
+        with np.errstate(divide='ignore'):
+            found = np.log(detection * best / chance)
+            missing = np.log((1 - detection) / (1 - chance))
+        found_line = expected & (found > missing)
+        evidence = np.where(expected, np.where(found_line, found, missing), 0.0)
+        scores = np.where(expected.any(axis=1), evidence.sum(axis=1), -np.inf)
+        matched = found_line.sum(axis=1)
+
+        #Only elements with at least one matched line can be candidates
+        keep = np.flatnonzero((matched > 0) & (scores > min_score))
+        keep = keep[np.argsort(-scores[keep], kind='stable')]
+        if limit is not None:
+            keep = keep[:limit]
+        if len(keep) == 0:
+            return []
+
+        #Softmax over the kept scores, so probabilities compare candidates of this spectrum
+        likelihood = np.exp((scores[keep] - scores[keep[0]]) / temperature)
+        probabilities = likelihood / likelihood.sum()
+
+        candidates = []
+        for i, probability in zip(keep.tolist(), probabilities.tolist()):
+            lines = [(float(self.lines[i, j]), float(peaks[best_peak[i, j]])) for j in np.flatnonzero(found_line[i])]
+            candidates.append(Candidate(self.element_names[i], float(scores[i]), probability,
+                                        int(matched[i]), int(expected[i].sum()), lines))
+        return candidates
+
+    #Ranked candidates for a SpectrumResult, the observed range comes from its wavelength axis
+    def score_result(self, result, **kwargs):
+        wavelengths = result.wavelengths
+        return self.score(result.peak_wavelengths, result.peak_intensities,
+                          (wavelengths[0], wavelengths[-1]) if len(wavelengths) else None, **kwargs)
+
+
+#Scorers over the shared element_data table, one per match tolerance, built on first use
+_default_scorers = {}
+
+
+def default_scorer(tolerance=10):
+    if tolerance not in _default_scorers:
+        from .linedb import default_line_table
+        table = default_line_table()
+        _default_scorers[tolerance] = ElementScorer(table.element_data(), tolerance=tolerance,
+                                                    line_weights=table.line_weights())
+    return _default_scorers[tolerance]
+
+
+#Print the most likely elements of a scored SpectrumResult, one line each
+#The score adds up the evidence of every line, found or missing; above 0 the lines fit better
+#than chance. The share only compares the candidates of this spectrum with each other
+def print_candidates(result, limit=5):
+    for candidate in (result.candidates or [])[:limit]:
+        print(f"{candidate.element}: score {candidate.score:.2f}, {candidate.matched}/{candidate.expected} lines "
+              f"({candidate.probability:.0%} share among candidates)")
+
+
+#Ranked element candidates for a list of peaks, best first
+def rank_elements(peak_wavelengths, peak_intensities=None, wavelength_range=None, limit=None, tolerance=10):
+    return default_scorer(tolerance).score(peak_wavelengths, peak_intensities, wavelength_range, limit=limit)
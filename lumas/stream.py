@@ -0,0 +1,195 @@
+#LIVE FRAME SOURCES
+#Fetching runs on its own thread so network round trips overlap with analysis
+
+#Libraries
+import queue
+import re
+import sys
+import threading
+import time
+from collections import namedtuple
+
+import requests
+
+#One fetched frame: arrival time (time.time()) and the encoded image bytes
+Frame = namedtuple('Frame', ['timestamp', 'data'])
+
+
+#Polls a single-shot JPEG URL (e.g. /shot.jpg) over one keep-alive session
+#Only the newest max_frames frames are kept, older ones are dropped so the
+#analysis always works on the most recent frame
+#recorder (a lumas.recording.FrameRecorder) gets every fetched frame, dropped ones included
+class FrameFetcher:
+    #Live sources never run out of frames, a replayed recording does
+    finished = False
+
+    def __init__(self, url, timeout=5.0, max_frames=1, timer=None, retry_delay=0.5, recorder=None):
+        self.url = url
+        self.timeout = timeout
+        self.timer = timer
+        self.retry_delay = retry_delay
+        self.recorder = recorder
+        self.frames = queue.Queue(maxsize=max_frames)
+        self.session = self._open_session()
+        self.fetched = 0
+        self.dropped = 0
+        self.errors = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='frame-fetcher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.timeout + 1)
+        if self.session is not None:
+            self.session.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _open_session(self):
+        return requests.Session()
+
+    #Newest frame, waiting up to timeout seconds; None if nothing arrived
+    def get(self, timeout=None):
+        try:
+            return self.frames.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _put(self, frame):
+        if self.recorder is not None:
+            self.recorder.write(frame)
+        while True:
+            try:
+                self.frames.put_nowait(frame)
+                return
+            except queue.Full:
+                try:
+                    self.frames.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def _fetch(self):
+        response = self.session.get(self.url, timeout=self.timeout)
+        response.raise_for_status()
+        return response.content
+
+    def _run(self):
+        while not self._stop.is_set():
+            start = time.perf_counter()
+            try:
+                data = self._fetch()
+            except Exception as e:
+                self.errors += 1
+                print(f"Error: {e}", file=sys.stderr)
+                self._stop.wait(self.retry_delay)
+                continue
+            if self.timer is not None:
+                self.timer.add('fetch', time.perf_counter() - start)
+            self.fetched += 1
+            self._put(Frame(time.time(), data))
+
+
+#JPEG start/end of image markers
+SOI = b'\xff\xd8'
+EOI = b'\xff\xd9'
+_CONTENT_LENGTH = re.compile(rb'content-length:\s*(\d+)', re.IGNORECASE)
+#Blank line ending a part's header block
+_HEADER_END = b'\r\n\r\n'
+#Bytes kept while waiting for a header end or SOI marker, beyond that they are dropped as junk
+_MAX_HEADER = 16 * 1024
+
+
+#Incremental parser for multipart/x-mixed-replace MJPEG bodies
+#feed() takes whatever chunk the socket gave and returns the JPEGs completed by it
+#One bytearray is reused for the whole stream; the part's Content-Length is used when
+#the server sends it (read once the header block is complete, whichever chunks it came
+#in), otherwise the frame ends at the JPEG end-of-image marker
+class MJPEGParser:
+    def __init__(self):
+        self.buffer = bytearray()
+        self._in_frame = False
+        self._length = None
+        self._scan = 0
+
+    def feed(self, chunk):
+        buffer = self.buffer
+        buffer += chunk
+        frames = []
+        while True:
+            if not self._in_frame:
+                soi = buffer.find(SOI)
+                head_end = buffer.find(_HEADER_END, 0, soi if soi >= 0 else len(buffer))
+                if head_end >= 0:
+                    #A complete header block, its Content-Length holds for the JPEG that follows
+                    match = _CONTENT_LENGTH.search(buffer, 0, head_end)
+                    self._length = int(match.group(1)) if match else None
+                    del buffer[:head_end + len(_HEADER_END)]
+                    continue
+                if soi < 0:
+                    #Headers still arriving; keep the tail in case a marker was split
+                    if len(buffer) > _MAX_HEADER:
+                        del buffer[:len(buffer) - len(_HEADER_END) + 1]
+                    break
+                del buffer[:soi]
+                self._in_frame = True
+                self._scan = len(SOI)
+
+            if self._length is not None:
+                if len(buffer) < self._length:
+                    break
+                end = self._length
+            else:
+                eoi = buffer.find(EOI, self._scan)
+                if eoi < 0:
+                    self._scan = max(len(buffer) - 1, len(SOI))
+                    break
+                end = eoi + len(EOI)
+
+            with memoryview(buffer) as view:
+                frames.append(bytes(view[:end]))
+            del buffer[:end]
+            self._in_frame = False
+            self._length = None
+        return frames
+
+
+#Reads a continuous MJPEG stream (e.g. /video) over one long-lived response
+#Same interface as FrameFetcher: get() returns the newest frame, stale ones are dropped
+class MJPEGStream(FrameFetcher):
+    def __init__(self, url, timeout=5.0, max_frames=1, timer=None, retry_delay=0.5, chunk_size=64 * 1024,
+                 recorder=None):
+        super().__init__(url, timeout, max_frames, timer, retry_delay, recorder)
+        self.chunk_size = chunk_size
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                with self.session.get(self.url, stream=True, timeout=self.timeout) as response:
+                    response.raise_for_status()
+                    parser = MJPEGParser()
+                    last = time.perf_counter()
+                    for chunk in response.iter_content(self.chunk_size):
+                        if self._stop.is_set():
+                            break
+                        for data in parser.feed(chunk):
+                            now = time.perf_counter()
+                            if self.timer is not None:
+                                self.timer.add('fetch', now - last)
+                            last = now
+                            self.fetched += 1
+                            self._put(Frame(time.time(), data))
+            except Exception as e:
+                self.errors += 1
+                print(f"Error: {e}", file=sys.stderr)
+                self._stop.wait(self.retry_delay)
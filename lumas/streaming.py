@@ -0,0 +1,200 @@
+#STREAMING SPECTRUM PROCESSOR
+#Stateful version of analyse_intensity for live frames: the smoothing kernel is built
+#once, the threshold is averaged over frames (the baseline fit starts from the previous
+#frame's), and peaks are tracked between frames so element lookups only run for peaks
+#that appear or move
+
+#Libraries
+import numpy as np
+from scipy.signal import find_peaks, savgol_coeffs
+
+from .baseline import als_baseline, estimate_baseline, local_noise
+from .calibration import default_calibration
+from .lines import default_line_index
+from .peaks import measure_peaks
+from .pipeline import (BASELINE_METHOD, PEAK_REFINEMENT, PROMINENCE_NOISE_FACTOR, SMOOTHING_ORDER, SMOOTHING_WINDOW,
+                       THRESHOLD_METHOD, THRESHOLD_NOISE_FACTOR, THRESHOLD_STD_FACTOR, SpectrumResult)
+from .timing import timed
+
+
+#Savitzky-Golay smoothing as a precomputed operator: one convolution kernel for the
+#interior and two small fit matrices for the edges (same result as savgol_filter's
+#default 'interp' mode). Output buffers are reused per width.
+class SavgolSmoother:
+    def __init__(self, window_length=SMOOTHING_WINDOW, polyorder=SMOOTHING_ORDER):
+        self.window_length = window_length
+        self.half = window_length // 2
+        self.kernel = savgol_coeffs(window_length, polyorder)
+
+        #Polynomial fitted to the first/last window evaluated at the edge positions
+        vander = np.vander(np.arange(window_length), polyorder + 1, increasing=True)
+        fit = np.linalg.pinv(vander)
+        self.left = vander[:self.half] @ fit
+        self.right = vander[window_length - self.half:] @ fit
+        self._out = None
+
+    def __call__(self, intensity):
+        n = len(intensity)
+        if n < self.window_length:
+            raise ValueError(f"Spectrum is narrower than the smoothing window ({n} < {self.window_length}).")
+        if self._out is None or len(self._out) != n:
+            self._out = np.empty(n)
+        out = self._out
+        half = self.half
+        out[half:n - half] = np.convolve(intensity, self.kernel, mode='valid')
+        out[:half] = self.left @ intensity[:self.window_length]
+        out[n - half:] = self.right @ intensity[n - self.window_length:]
+        return out
+
+
+#Live processor: stabilisation average, smoothing, running threshold, peak detection,
+#peak tracking and element matching, one call per frame
+#stabilization_factor: weight of the previous frame in the intensity average (0 disables)
+#threshold_decay: weight of past frames in the threshold (0 = per frame)
+#threshold_method, baseline_method: see pipeline.THRESHOLD_METHOD and pipeline.BASELINE_METHOD
+#track_distance: max pixels a peak may move between frames and keep its id
+#timer: optional StageTimer that records the smoothing, peaks, matching and scoring stages
+#scorer: optional scoring.ElementScorer, every frame then carries ranked element candidates
+#refine: sub-pixel method for the peak wavelengths (see pipeline.PEAK_REFINEMENT), None keeps whole pixels
+class StreamingProcessor:
+    def __init__(self, tolerance=10, calibration=None, line_index=None, stabilization_factor=0.9,
+                 threshold_decay=0.5, track_distance=3, window_length=SMOOTHING_WINDOW, polyorder=SMOOTHING_ORDER,
+                 timer=None, scorer=None, refine=PEAK_REFINEMENT, threshold_method=THRESHOLD_METHOD,
+                 baseline_method=BASELINE_METHOD):
+        if threshold_method not in ('adaptive', 'global'):
+            raise ValueError(f"Unknown threshold method '{threshold_method}', use 'adaptive' or 'global'.")
+        self.tolerance = tolerance
+        self.calibration = calibration if calibration is not None else default_calibration
+        self.line_index = line_index if line_index is not None else default_line_index()
+        self.stabilization_factor = stabilization_factor
+        self.threshold_decay = threshold_decay
+        self.track_distance = track_distance
+        self.smoother = SavgolSmoother(window_length, polyorder)
+        self.timer = timer
+        self.scorer = scorer
+        self.refine = refine
+        self.threshold_method = threshold_method
+        self.baseline_method = baseline_method
+        self.next_id = 0
+        self.lookups = 0
+        self.reset()
+
+    #Forget all frame history (e.g. after the camera or ROI changed)
+    def reset(self):
+        self.average = None
+        self.mean = None
+        self.variance = None
+        self.threshold = None
+        self.baseline_weights = None
+        self.peaks = np.empty(0, dtype=np.intp)
+        self.peak_ids = np.empty(0, dtype=np.intp)
+        self.elements = []
+
+    def _stabilize(self, intensity):
+        if self.average is None or len(self.average) != len(intensity):
+            self.reset()
+            self.average = np.array(intensity, dtype=float)
+        elif self.stabilization_factor:
+            self.average *= self.stabilization_factor
+            self.average += (1 - self.stabilization_factor) * intensity
+        else:
+            self.average[:] = intensity
+        return self.average
+
+    #Returns (threshold, local noise, baseline), the last two None for 'global'
+    def _threshold(self, intensity, smoothed_intensity):
+        if self.threshold_method == 'adaptive':
+            return self._adaptive_threshold(intensity, smoothed_intensity)
+        mean = smoothed_intensity.mean()
+        variance = smoothed_intensity.var()
+        if self.mean is None:
+            self.mean, self.variance = mean, variance
+        else:
+            decay = self.threshold_decay
+            self.mean = decay * self.mean + (1 - decay) * mean
+            self.variance = decay * self.variance + (1 - decay) * variance
+        return self.mean + np.sqrt(self.variance) * THRESHOLD_STD_FACTOR, None, None
+
+    #Baseline plus local noise, the ALS fit starts from the previous frame's weights and
+    #usually settles in one or two solves
+    def _adaptive_threshold(self, intensity, smoothed_intensity):
+        if self.baseline_method == 'als':
+            baseline, self.baseline_weights = als_baseline(smoothed_intensity, weights=self.baseline_weights)
+        else:
+            baseline = estimate_baseline(smoothed_intensity, self.baseline_method)
+        noise = local_noise(intensity, smoothed_intensity)
+        threshold = baseline + THRESHOLD_NOISE_FACTOR * noise
+        if self.threshold is not None and len(self.threshold) == len(threshold):
+            decay = self.threshold_decay
+            threshold = decay * self.threshold + (1 - decay) * threshold
+        self.threshold = threshold
+        return threshold, noise, baseline
+
+    #Match peaks to the previous frame's peaks, nearest first and one to one
+    #Returns (index into the previous peaks or -1, distance in pixels)
+    def _track(self, peaks):
+        previous = self.peaks
+        matches = np.full(len(peaks), -1, dtype=np.intp)
+        distances = np.zeros(len(peaks), dtype=np.intp)
+        if not len(previous) or not len(peaks):
+            return matches, distances
+
+        right = np.clip(np.searchsorted(previous, peaks), 0, len(previous) - 1)
+        left = np.clip(right - 1, 0, len(previous) - 1)
+        use_left = np.abs(peaks - previous[left]) < np.abs(peaks - previous[right])
+        nearest = np.where(use_left, left, right)
+        distances = np.abs(peaks - previous[nearest])
+
+        close = np.flatnonzero(distances <= self.track_distance)
+        close = close[np.argsort(distances[close], kind='stable')]
+        _, first = np.unique(nearest[close], return_index=True)
+        kept = close[first]
+        matches[kept] = nearest[kept]
+        return matches, distances
+
+    def process(self, intensity):
+        timer = self.timer
+        with timed(timer, 'smoothing'):
+            intensity = self._stabilize(intensity)
+            smoothed_intensity = self.smoother(intensity).copy()
+        wavelengths = self.calibration.axis(len(smoothed_intensity))
+        with timed(timer, 'peaks'):
+            threshold, noise, baseline = self._threshold(intensity, smoothed_intensity)
+            prominence = PROMINENCE_NOISE_FACTOR * noise if noise is not None else None
+            peaks, _ = find_peaks(smoothed_intensity, height=threshold, prominence=prominence)
+            peak_metrics = measure_peaks(intensity, smoothed_intensity, peaks, self.calibration,
+                                         self.refine or 'parabolic', noise)
+            peak_wavelengths = peak_metrics.wavelengths if self.refine else wavelengths[peaks]
+        with timed(timer, 'matching'):
+            result = self._match(intensity, smoothed_intensity, wavelengths, threshold, peaks, peak_wavelengths)
+        result.peak_metrics = peak_metrics
+        result.baseline = baseline
+        if self.scorer is not None:
+            with timed(timer, 'scoring'):
+                result.candidates = self.scorer.score_result(result)
+        return result
+
+    #Peak tracking and element lookups for new or moved peaks
+    def _match(self, intensity, smoothed_intensity, wavelengths, threshold, peaks, peak_wavelengths):
+        matches, distances = self._track(peaks)
+        tracked = matches >= 0
+        peak_ids = np.empty(len(peaks), dtype=np.intp)
+        peak_ids[tracked] = self.peak_ids[matches[tracked]]
+        new = np.flatnonzero(~tracked)
+        peak_ids[new] = np.arange(self.next_id, self.next_id + len(new))
+        self.next_id += len(new)
+
+        #Element lookups only for peaks that are new or moved (a peak on the same pixel keeps
+        #its matches while its sub-pixel centre jitters)
+        elements = [self.elements[m] if m >= 0 and d == 0 else None for m, d in zip(matches, distances)]
+        changed = [i for i, e in enumerate(elements) if e is None]
+        if changed:
+            self.lookups += len(changed)
+            for i, found in zip(changed, self.line_index.query(peak_wavelengths[changed], self.tolerance)):
+                elements[i] = found
+
+        self.peaks = peaks
+        self.peak_ids = peak_ids
+        self.elements = elements
+        return SpectrumResult(intensity.copy(), smoothed_intensity, wavelengths, threshold, peaks, peak_wavelengths,
+                              elements, peak_ids)
@@ -0,0 +1,114 @@
+#LOOP TIMING
+#Low-overhead stage timers: every sample is one perf_counter difference written into a
+#fixed-size ring buffer, percentiles are only computed when a report is asked for
+
+#Libraries
+import cProfile
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+
+PERCENTILES = (50, 95, 99)
+
+
+#Rolling per-stage latency (p50/p95/p99 over the last `window` samples of each stage)
+#and achieved frames per second; stages can be recorded from several threads
+class StageTimer:
+    def __init__(self, report_interval=5.0, window=1000):
+        self.report_interval = report_interval
+        self.window = window
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.counts = {}
+        self.frames = 0
+        self.window_frames = 0
+        self.window_start = time.perf_counter()
+
+    def add(self, name, seconds):
+        with self._lock:
+            ring = self.samples.get(name)
+            if ring is None:
+                ring = self.samples[name] = np.empty(self.window)
+                self.counts[name] = 0
+            ring[self.counts[name] % self.window] = seconds
+            self.counts[name] += 1
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def frame_done(self):
+        with self._lock:
+            self.frames += 1
+            self.window_frames += 1
+
+    #{stage: (p50, p95, p99)} in seconds over each stage's rolling window
+    def percentiles(self):
+        with self._lock:
+            return {name: tuple(np.percentile(ring[:min(self.counts[name], self.window)], PERCENTILES))
+                    for name, ring in self.samples.items()}
+
+    #One line with FPS since the last report, p50/p95/p99 ms per stage and any counters,
+    #or None if report_interval has not passed yet (force=True always reports)
+    def report(self, force=False, **counters):
+        now = time.perf_counter()
+        elapsed = now - self.window_start
+        if not force and elapsed < self.report_interval:
+            return None
+        stages = ', '.join(f"{name} {'/'.join(f'{1000 * value:.1f}' for value in values)}"
+                           for name, values in self.percentiles().items())
+        with self._lock:
+            parts = [f"FPS {self.window_frames / elapsed:.1f}"] if self.frames else []
+            self.window_frames = 0
+            self.window_start = now
+        if stages:
+            parts.append(f"ms p50/p95/p99: {stages}")
+        parts += [f"{name} {value}" for name, value in counters.items()]
+        return ' | '.join(parts)
+
+
+#timer.stage(name) if a timer is given, otherwise a no-op context
+def timed(timer, name):
+    return timer.stage(name) if timer is not None else nullcontext()
+
+
+#Opt-in cProfile run covering the next `frames` frames, then dumps the stats to path
+#and prints the top functions by cumulative time to log (e.g. stderr when stdout carries records)
+class FrameProfiler:
+    def __init__(self, frames, path='lumas.prof', top=25, log=None):
+        self.frames = frames
+        self.path = path
+        self.top = top
+        self.log = log if log is not None else sys.stdout
+        self.seen = 0
+        self.profile = cProfile.Profile() if frames > 0 else None
+        if self.profile is not None:
+            self.profile.enable()
+
+    @property
+    def active(self):
+        return self.profile is not None
+
+    def frame_done(self):
+        if self.profile is None:
+            return
+        self.seen += 1
+        if self.seen >= self.frames:
+            self.stop()
+
+    def stop(self):
+        if self.profile is None:
+            return
+        self.profile.disable()
+        self.profile.dump_stats(self.path)
+        print(f"Profile of {self.seen} frames written to '{self.path}'.", file=self.log)
+        pstats.Stats(self.profile, stream=self.log).sort_stats('cumulative').print_stats(self.top)
+        self.profile = None
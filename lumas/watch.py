@@ -0,0 +1,255 @@
+#FOLDER WATCHER
+#Long-running watch mode: every new image is queued once it has been fully written
+#and analysed exactly once, using inotify where available and polling otherwise
+
+#Libraries
+import argparse
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+from collections import deque
+
+from .accumulate import load_correction
+from .archive import SpectrumArchive
+from .batch import IMAGE_EXTENSIONS, analyse_file, move_to_processed, open_summary_csv, pending_images
+from .calibration import load_calibration
+from .pipeline import SPECTRUM_ROW, parse_row
+
+#inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_CLOEXEC = os.O_CLOEXEC if hasattr(os, 'O_CLOEXEC') else 0
+
+#struct inotify_event header: wd, mask, cookie, len (the name follows)
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+def _is_image(name):
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+#inotify through libc, a file is complete when it is closed after writing or moved in
+#wait() returns the completed names, or None when the kernel queue overflowed
+class _InotifySource:
+    def __init__(self, folder):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError("inotify is not available on this platform")
+        fd = libc.inotify_init1(IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(fd, os.fsencode(folder), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            errno = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(errno, f"cannot watch '{folder}'")
+        self.fd = fd
+
+    def wait(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        data = os.read(self.fd, 64 * 1024)
+        names = []
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if _is_image(name):
+                names.append(name)
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+#Polling fallback, a file is complete once it is non-empty, its size and mtime have not changed
+#for settle_time seconds since they were first seen, and its mtime is at least settle_time old
+#(so a writer pausing between two polls does not get its partial file analysed)
+class _PollingSource:
+    def __init__(self, folder, settle_time=1.0):
+        self.folder = folder
+        self.settle_time = settle_time
+        #name -> ((size, mtime), time this signature was first seen)
+        self.signatures = {}
+
+    def wait(self, timeout):
+        time.sleep(timeout)
+        now = time.time()
+        current = {}
+        names = []
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if entry.is_file() and _is_image(entry.name):
+                    stat = entry.stat()
+                    signature = (stat.st_size, stat.st_mtime_ns)
+                    previous = self.signatures.get(entry.name)
+                    since = previous[1] if previous is not None and previous[0] == signature else now
+                    current[entry.name] = (signature, since)
+                    if (stat.st_size and now - since >= self.settle_time
+                            and now - stat.st_mtime_ns / 1e9 >= self.settle_time):
+                        names.append(entry.name)
+        self.signatures = current
+        return names
+
+    def close(self):
+        pass
+
+
+#Iterating a FolderWatcher yields the path of every new, fully written image
+#Images already waiting when it starts are yielded first, oldest first
+#settle_time: seconds a file must stay unchanged before the polling fallback takes it,
+#default poll_interval; has to exceed the longest pause of the program writing the images
+#Images found by a full scan (at start, or after an inotify overflow) saw no close event, they
+#are only taken once non-empty with an mtime at least settle_time old, and rechecked until then
+class FolderWatcher:
+    def __init__(self, folder, poll_interval=1.0, use_inotify=True, settle_time=None):
+        self.folder = folder
+        self.poll_interval = poll_interval
+        self.settle_time = poll_interval if settle_time is None else settle_time
+        self.source = None
+        if use_inotify:
+            try:
+                self.source = _InotifySource(folder)
+            except OSError:
+                self.source = None
+        if self.source is None:
+            self.source = _PollingSource(folder, self.settle_time)
+
+        self.queue = deque()
+        self.queued = set()
+        #Scanned images still being written, rechecked after every wait
+        self.settling = set()
+        #name -> (size, mtime) of images handled but still in the folder (e.g. failed ones),
+        #so they are not handled again unless the file changes
+        self.handled = {}
+        self._enqueue_settled([os.path.basename(path) for path in pending_images(folder)])
+
+    @property
+    def uses_inotify(self):
+        return isinstance(self.source, _InotifySource)
+
+    def _enqueue(self, names):
+        for name in names:
+            self.settling.discard(name)
+            if name not in self.queued:
+                self.queued.add(name)
+                self.queue.append(name)
+
+    #Queue the scanned names whose files have settled, keep the others for a later check
+    def _enqueue_settled(self, names):
+        now = time.time()
+        settled = []
+        for name in names:
+            try:
+                stat = os.stat(os.path.join(self.folder, name))
+            except FileNotFoundError:
+                self.settling.discard(name)
+                continue
+            if stat.st_size and now - stat.st_mtime_ns / 1e9 >= self.settle_time:
+                settled.append(name)
+            else:
+                self.settling.add(name)
+        self._enqueue(settled)
+
+    def _signature(self, path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_size, stat.st_mtime_ns)
+
+    def __iter__(self):
+        while True:
+            while self.queue:
+                name = self.queue.popleft()
+                self.queued.discard(name)
+                path = os.path.join(self.folder, name)
+                signature = self._signature(path)
+                if signature is None or self.handled.get(name) == signature:
+                    continue
+                yield path
+                #Moved away by the handler: forget it, a new file with this name is a new image
+                if os.path.exists(path):
+                    self.handled[name] = signature
+                else:
+                    self.handled.pop(name, None)
+
+            names = self.source.wait(self.poll_interval)
+            if names is None:
+                #Events were lost, fall back to one full scan
+                self._enqueue_settled([os.path.basename(path) for path in pending_images(self.folder)])
+            else:
+                self._enqueue(names)
+            if self.settling:
+                self._enqueue_settled(sorted(self.settling))
+
+    def close(self):
+        self.source.close()
+
+
+#Watch folder until interrupted, analysing every new image and appending its summary row
+#Images move to 'processed' once their row is written, failed ones stay in place
+#With archive (a folder) every analysed spectrum is also appended to a SpectrumArchive
+#settle_time: see FolderWatcher
+def run_watch(folder, output_path=None, tolerance=2, row=SPECTRUM_ROW, calibration=None, poll_interval=1.0,
+              use_inotify=True, correction=None, archive=None, settle_time=None):
+    if output_path is None:
+        output_path = os.path.join(folder, 'summary.csv')
+    processed_folder = os.path.join(folder, 'processed')
+    os.makedirs(processed_folder, exist_ok=True)
+
+    watcher = FolderWatcher(folder, poll_interval, use_inotify, settle_time)
+    print(f"Watching '{folder}' ({'inotify' if watcher.uses_inotify else 'polling'})...")
+    store = SpectrumArchive(archive) if archive else None
+    f, writer = open_summary_csv(output_path)
+    try:
+        with f:
+            for image_path in watcher:
+                summary, result = analyse_file(image_path, tolerance, row, calibration, correction, keep_result=True)
+                if store is not None and result is not None:
+                    store.append(result, summary['image'], os.path.getmtime(image_path))
+                writer.writerow(summary)
+                f.flush()
+                if summary['error']:
+                    print(f"Error: {summary['image']}: {summary['error']}")
+                else:
+                    move_to_processed(image_path, processed_folder)
+                    print(f"Image '{summary['image']}' analysed, {summary['peak_count']} peaks.")
+    except KeyboardInterrupt:
+        print("Stopping folder watch...")
+    finally:
+        watcher.close()
+        if store is not None:
+            store.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse every new image that arrives in a folder.")
+    parser.add_argument('folder')
+    parser.add_argument('--output', help="summary CSV, default <folder>/summary.csv")
+    parser.add_argument('--tolerance', type=float, default=2)
+    parser.add_argument('--row', type=parse_row, default=SPECTRUM_ROW, help="row number, top:bottom or 'auto'")
+    parser.add_argument('--calibration', help="saved calibration file, default the built-in calibration")
+    parser.add_argument('--correction', help="dark-frame / flat-field file from python -m lumas.accumulate")
+    parser.add_argument('--archive', help="spectrum archive folder to append every analysed spectrum to")
+    parser.add_argument('--poll-interval', type=float, default=1.0)
+    parser.add_argument('--no-inotify', action='store_true', help="always use the polling fallback")
+    parser.add_argument('--settle-time', type=float,
+                        help="seconds an image must stay unchanged before polling (or the startup scan) takes it, "
+                             "longer than the writer's longest pause (default the poll interval)")
+    args = parser.parse_args(argv)
+    run_watch(args.folder, args.output, args.tolerance, args.row, load_calibration(args.calibration),
+              args.poll_interval, not args.no_inotify, load_correction(args.correction), args.archive,
+              args.settle_time)
+
+
+if __name__ == '__main__':
+    main()
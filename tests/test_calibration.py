@@ -0,0 +1,20 @@
+import numpy as np
+
+from lumas.archive import AxisCalibration
+from lumas.calibration import Calibration
+
+
+def test_wavelength_to_pixel_inverts_the_axis():
+    for wavelengths in ([400, 500, 600, 700], [700, 600, 500, 400]):
+        calibration = Calibration([100, 500, 800, 1200], wavelengths)
+        pixels = np.array([10.25, 640.5, 1200.75])
+        found = calibration.wavelength_to_pixel(calibration.pixel_to_wavelength(pixels), 1280)
+        assert np.allclose(found, pixels, atol=1e-3)
+
+
+def test_axis_calibration_matches_its_calibration():
+    calibration = Calibration([100, 500, 800, 1200], [700, 600, 500, 400])
+    stored = AxisCalibration(calibration.axis(1280))
+    wavelengths = [420.0, 555.5, 690.0]
+    assert np.allclose(stored.wavelength_to_pixel(wavelengths, 1280),
+                       calibration.wavelength_to_pixel(wavelengths, 1280), atol=1e-3)
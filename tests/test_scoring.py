@@ -0,0 +1,28 @@
+from lumas.scoring import ElementScorer, rank_elements
+
+
+def test_one_peak_between_two_lines_matches_one_line():
+    scorer = ElementScorer({'A': [403.1, 404.4], 'B': [600.0]})
+    [a] = scorer.score([405.0], wavelength_range=(370, 900))
+    #The peak only counts for 404.4, the closer line, 403.1 is missing
+    assert (a.element, a.matched, a.expected) == ('A', 1, 2)
+    assert a.lines == [(404.4, 405.0)]
+
+
+def test_two_peaks_match_two_lines():
+    scorer = ElementScorer({'A': [403.1, 404.4], 'B': [600.0]})
+    [a] = scorer.score([403.2, 404.5], wavelength_range=(370, 900))
+    assert (a.element, a.matched) == ('A', 2)
+    assert a.lines == [(403.1, 403.2), (404.4, 404.5)]
+
+
+def test_manganese_is_not_credited_twice_for_one_peak():
+    manganese = [c for c in rank_elements([405.0], wavelength_range=(370, 900)) if c.element == 'Manganese']
+    assert all(candidate.matched == 1 for candidate in manganese)
+
+
+def test_tolerance_reaches_the_scorer():
+    #4 nm off: within a 10 nm tolerance, outside a 2 nm one
+    assert ElementScorer({'H': [656.3]}, tolerance=10).score([660.3], wavelength_range=(380, 700))
+    assert ElementScorer({'H': [656.3]}, tolerance=2).score([660.3], wavelength_range=(380, 700)) == []
+    assert all(c.element != 'Hydrogen' for c in rank_elements([660.3], wavelength_range=(380, 700), tolerance=2))
@@ -0,0 +1,104 @@
+import importlib.util
+import os
+import sys
+import time
+
+import pytest
+
+from lumas.stream import FrameFetcher, MJPEGParser, MJPEGStream
+
+BENCHMARKS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks')
+
+
+#Minimal JPEG-framed payloads; the second carries an EXIF-style thumbnail with its own FFD9
+PLAIN = b'\xff\xd8' + bytes(range(1, 200)) + b'\xff\xd9'
+THUMBNAIL = (b'\xff\xd8\xff\xe1\x00\x20Exif\x00\x00' + b'\xff\xd8thumb\xff\xd9' + b'\x00' * 8
+             + bytes(range(1, 100)) + b'\xff\xd9')
+
+
+def mjpeg_body(frames, content_length):
+    parts = []
+    for data in frames:
+        header = b'--lumasframe\r\nContent-Type: image/jpeg\r\n'
+        if content_length:
+            header += f"Content-Length: {len(data)}\r\n".encode()
+        parts.append(header + b'\r\n' + data + b'\r\n')
+    return b''.join(parts)
+
+
+def feed_chunks(body, sizes):
+    parser = MJPEGParser()
+    frames = []
+    offset = 0
+    i = 0
+    while offset < len(body):
+        size = sizes[i % len(sizes)]
+        frames += parser.feed(body[offset:offset + size])
+        offset += size
+        i += 1
+    return frames
+
+
+@pytest.mark.parametrize('sizes', [[1], [2, 3, 5, 7], [17], [40, 1, 300], [10 ** 6]])
+def test_parser_with_content_length_keeps_thumbnail_frames_whole(sizes):
+    frames = [PLAIN, THUMBNAIL, PLAIN, THUMBNAIL]
+    assert feed_chunks(mjpeg_body(frames, True), sizes) == frames
+
+
+@pytest.mark.parametrize('sizes', [[1], [2, 3, 5, 7], [17], [10 ** 6]])
+def test_parser_without_content_length_ends_frames_at_eoi(sizes):
+    frames = [PLAIN, PLAIN[:50] + b'\x00\xff' + PLAIN[50:], PLAIN]
+    assert feed_chunks(mjpeg_body(frames, False), sizes) == frames
+
+
+def test_parser_content_length_read_apart_from_the_jpeg():
+    #Header block in one read, the JPEG (with its thumbnail FFD9) in the next
+    body = mjpeg_body([THUMBNAIL], True)
+    split = body.index(b'\r\n\r\n') + 4
+    parser = MJPEGParser()
+    assert parser.feed(body[:split]) == []
+    assert parser.feed(body[split:]) == [THUMBNAIL]
+
+
+@pytest.fixture(scope='module')
+def stub():
+    sys.path.insert(0, BENCHMARKS)
+    try:
+        spec = importlib.util.spec_from_file_location('lumas_benchmark_multisource',
+                                                      os.path.join(BENCHMARKS, 'multisource.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(BENCHMARKS)
+    frames = [module.synthetic_capture(320, 5, seed) for seed in range(2)] + [THUMBNAIL]
+    servers = [module.stub_camera(frames, 50), module.stub_camera(frames, 50, chunked=True)]
+    yield frames, [f"http://127.0.0.1:{server.server_address[1]}" for server in servers]
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def collect(fetcher, count, timeout=10.0):
+    received = []
+    deadline = time.monotonic() + timeout
+    with fetcher:
+        while len(received) < count and time.monotonic() < deadline:
+            frame = fetcher.get(timeout=0.5)
+            if frame is not None:
+                received.append(frame.data)
+    return received
+
+
+def test_frame_fetcher_against_stub(stub):
+    frames, urls = stub
+    received = collect(FrameFetcher(urls[0] + '/shot.jpg', timeout=2), 5)
+    assert len(received) == 5
+    assert all(data in frames for data in received)
+
+
+@pytest.mark.parametrize('server', [0, 1], ids=['plain', 'chunked'])
+def test_mjpeg_stream_against_stub(stub, server):
+    frames, urls = stub
+    received = collect(MJPEGStream(urls[server] + '/video', timeout=2, max_frames=100), 6)
+    assert len(received) == 6
+    assert all(data in frames for data in received)